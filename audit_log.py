@@ -0,0 +1,125 @@
+import glob
+import json
+import os
+from datetime import datetime
+from typing import Dict, Iterator, List
+
+
+class AuditLog:
+    """
+    Nhật ký thao tác dạng JSON Lines: mỗi thao tác là một dòng được nối vào cuối file,
+    file được mở một lần và không bao giờ được nạp lại vào bộ nhớ khi khởi động.
+    Khi file hiện tại vượt quá max_bytes (hoặc sang ngày mới nếu daily=True) nó được
+    đổi tên thành một phân đoạn cũ <tên>.<thời điểm>.jsonl và giữ lại trên đĩa.
+    Trong một giao dịch (begin/commit/rollback) các dòng được giữ trong bộ nhớ, ghi một lần khi
+    commit và bị bỏ khi rollback, để thao tác thất bại không để lại dòng nhật ký nào.
+    """
+    def __init__(self, log_file: str, max_bytes: int = 10 * 1024 * 1024, daily: bool = False):
+        # File JSON cũ (dạng mảng) được giữ nguyên như phân đoạn đầu tiên của nhật ký
+        stem, ext = os.path.splitext(log_file)
+        self.legacy_file = log_file if ext != ".jsonl" else None
+        self.path = stem + ".jsonl"
+        self.max_bytes = max_bytes
+        self.daily = daily
+        self._file = None
+        self._size = 0
+        self._opened_on = None
+        self._depth = 0
+        self._buffer = []
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._size = self._file.tell()
+        if self._size and os.path.exists(self.path):
+            self._opened_on = datetime.fromtimestamp(os.path.getmtime(self.path)).date()
+        else:
+            self._opened_on = datetime.now().date()
+
+    def _should_rotate(self, incoming: int) -> bool:
+        if not self._size:
+            return False
+        if self.max_bytes and self._size + incoming > self.max_bytes:
+            return True
+        return self.daily and datetime.now().date() != self._opened_on
+
+    def rotate(self):
+        """
+        Đóng file hiện tại và đổi tên thành một phân đoạn cũ
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if os.path.exists(self.path) and os.path.getsize(self.path):
+            stem = os.path.splitext(self.path)[0]
+            os.replace(self.path, f"{stem}.{datetime.now().strftime('%Y%m%d%H%M%S%f')}.jsonl")
+
+    def append(self, entry: Dict):
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        if self._depth:
+            self._buffer.append(line)
+        else:
+            self._write([line])
+
+    def _write(self, lines: List[str]):
+        if self._file is None:
+            self._open()
+        for line in lines:
+            if self._should_rotate(len(line.encode('utf-8'))):
+                self._file.flush()
+                self.rotate()
+                self._open()
+            self._file.write(line)
+            self._size += len(line.encode('utf-8'))
+        self._file.flush()
+
+    def begin(self):
+        self._depth += 1
+
+    def commit(self):
+        self._depth -= 1
+        if self._depth or not self._buffer:
+            return
+        lines, self._buffer = self._buffer, []
+        self._write(lines)
+
+    def rollback(self):
+        self._depth -= 1
+        if not self._depth:
+            self._buffer = []
+
+    def segments(self) -> list:
+        """
+        Danh sách các phân đoạn đã xoay vòng, cũ nhất trước
+        """
+        stem = glob.escape(os.path.splitext(self.path)[0])
+        return sorted(glob.glob(f"{stem}.*.jsonl"))
+
+    def entries(self) -> Iterator[Dict]:
+        """
+        Đọc tuần tự toàn bộ lịch sử (file JSON cũ, các phân đoạn, file hiện tại) khi thật sự cần
+        """
+        if self.legacy_file:
+            try:
+                with open(self.legacy_file, 'r', encoding='utf-8') as f:
+                    yield from json.load(f)
+            except (FileNotFoundError, ValueError):
+                pass
+
+        if self._file is not None:
+            self._file.flush()
+        for segment in self.segments() + [self.path]:
+            try:
+                with open(segment, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        if line.strip():
+                            yield json.loads(line)
+            except FileNotFoundError:
+                continue
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
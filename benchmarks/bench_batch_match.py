@@ -0,0 +1,87 @@
+"""
+So sánh so khớp mờ hàng loạt một danh sách tiêu đề với danh mục tài liệu: gọi search_documents lần lượt
+cho từng tiêu đề (như trước đây) và match_titles chia danh mục cho nhiều tiến trình. Đo riêng lần gọi đầu
+(khởi tạo pool, gửi danh mục), lần gọi sau (dùng lại pool) và chi phí của pool với một lô nhỏ.
+
+    python benchmarks/bench_batch_match.py                  # 10.000 tài liệu, 100 tiêu đề
+    python benchmarks/bench_batch_match.py 50000 1000       # số tài liệu, số tiêu đề
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_codecs import make_catalog
+from document_manager import DocumentManager
+from search_index import BatchMatcher
+
+
+def make_queries(catalog: list, count: int) -> list:
+    # Tiêu đề trong danh sách mua thường gõ không dấu, thiếu hoặc sai vài ký tự
+    random.seed(1)
+    queries = []
+    for _ in range(count):
+        title = list(random.choice(catalog)['title'].lower())
+        for _ in range(2):
+            del title[random.randrange(len(title))]
+        queries.append("".join(title))
+    return queries
+
+
+def timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main():
+    documents = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    catalog = make_catalog(documents)
+    queries = make_queries(catalog, count)
+
+    with tempfile.TemporaryDirectory() as data:
+        with open(os.path.join(data, "documents.json"), 'w', encoding='utf-8') as f:
+            json.dump(catalog, f, ensure_ascii=False)
+        doc_manager = DocumentManager(os.path.join(data, "documents.json"),
+                                      os.path.join(data, "document_requests.json"),
+                                      os.path.join(data, "document_logs.json"),
+                                      os.path.join(data, "document_categories.json"),
+                                      os.path.join(data, "document_ratings.json"), search_cache_size=0)
+
+        start = time.perf_counter()
+        for query in queries:
+            doc_manager.search_documents(title=query)
+        serial = time.perf_counter() - start
+
+        matcher = doc_manager.batch_matcher
+        single = timed(lambda: doc_manager.match_titles(queries, workers=1))
+        # Ép dùng pool (ít nhất 2 tiến trình) để đo riêng chi phí khởi tạo pool và gửi danh mục
+        workers = max(2, os.cpu_count() or 1)
+        matcher.min_parallel_work = 0
+        first = timed(lambda: doc_manager.match_titles(queries, workers=workers))
+        reused = timed(lambda: doc_manager.match_titles(queries, workers=workers))
+
+        small = queries[:5]
+        matcher.close()
+        small_pool = timed(lambda: doc_manager.match_titles(small, workers=workers))
+        matcher.close()
+        matcher.min_parallel_work = BatchMatcher().min_parallel_work
+        small_local = timed(lambda: doc_manager.match_titles(small, workers=workers))
+        doc_manager.close()
+
+    print(f"{documents} tài liệu, {count} tiêu đề, {os.cpu_count()} CPU, pool {workers} tiến trình")
+    print(f"{'search_documents lần lượt:':<42}{serial:.2f} s")
+    print(f"{'match_titles (1 tiến trình):':<42}{single:.2f} s")
+    print(f"{'match_titles (pool, lần đầu):':<42}{first:.2f} s")
+    print(f"{'match_titles (pool, dùng lại):':<42}{reused:.2f} s")
+    print(f"{f'{len(small)} tiêu đề, pool mới:':<42}{small_pool:.2f} s")
+    print(f"{f'{len(small)} tiêu đề, trong tiến trình (mặc định):':<42}{small_local:.2f} s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+So sánh thời gian ghi/đọc và kích thước file của các định dạng lưu trữ trên danh mục tài liệu.
+
+    python benchmarks/bench_codecs.py                   # danh mục giả lập 100.000 tài liệu
+    python benchmarks/bench_codecs.py documents.json    # dùng file danh mục thật
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from serialization import available_codecs, get_codec
+
+
+def make_catalog(count: int) -> list:
+    random.seed(0)
+    words = ["LẬP TRÌNH", "CƠ SỞ DỮ LIỆU", "TOÁN", "VĂN HỌC", "LỊCH SỬ", "MẠNG MÁY TÍNH", "KINH TẾ", "NHẬP MÔN"]
+    categories = ["SÁCH", "TẠP CHÍ", "SÁCH GIÁO KHOA", "TIỂU THUYẾT", "TÀI LIỆU THAM KHẢO"]
+    catalog = []
+    for i in range(count):
+        quantity = random.randint(0, 40)
+        catalog.append({
+            "doc_id": f"TL{str(i + 1).zfill(6)}",
+            "title": " ".join(random.sample(words, 3)),
+            "category": random.choice(categories),
+            "SoLuong": quantity,
+            "DacBiet": random.random() < 0.1,
+            "status": "available" if quantity else "unavailable",
+            "AvailableQuantity": quantity,
+            "deleted": False
+        })
+    return catalog
+
+
+def best_of(fn, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], 'r', encoding='utf-8') as f:
+            catalog = json.load(f)
+    else:
+        catalog = make_catalog(100_000)
+
+    print(f"{len(catalog)} tài liệu")
+    print(f"{'định dạng':<14}{'ghi (s)':>10}{'đọc (s)':>10}{'kích thước (MB)':>18}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in available_codecs():
+            codec = get_codec(name)
+            path = os.path.join(tmp, f"documents.{name}")
+
+            def save():
+                with open(path, 'wb') as f:
+                    f.write(codec.dumps(catalog))
+
+            def load():
+                with open(path, 'rb') as f:
+                    codec.loads(f.read())
+
+            save_time = best_of(save)
+            load_time = best_of(load)
+            size = os.path.getsize(path) / (1024 * 1024)
+            print(f"{name:<14}{save_time:>10.3f}{load_time:>10.3f}{size:>18.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Đo thời gian khởi động của một tiến trình chỉ làm nghiệp vụ mượn trả (tạo ba manager rồi tra cứu một tài liệu),
+so với khi phải nạp hết đề xuất, danh mục, đánh giá, nhật ký thao tác và thư viện fuzzywuzzy như trước đây.
+
+    python benchmarks/bench_startup.py
+"""
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_codecs import make_catalog
+
+PROCESS = """
+import sys, time
+start = time.perf_counter()
+sys.path.insert(0, {root!r})
+from reader_manager import ReaderManager
+from document_manager import DocumentManager
+from borrowing_manager import BorrowingManager
+d = {data!r}
+reader_manager = ReaderManager(d + "/users.json", {root!r} + "/reader_types.json", d + "/reader_logs.json")
+doc_manager = DocumentManager(d + "/documents.json", d + "/document_requests.json", d + "/document_logs.json",
+                              d + "/document_categories.json", d + "/document_ratings.json")
+borrowing_manager = BorrowingManager(d + "/borrow_records.json", d + "/return_records.json",
+                                     d + "/borrowing_logs.json", d + "/reservation_records.json")
+if {eager!r}:
+    # Mô phỏng cách nạp cũ: mọi tập dữ liệu và fuzzywuzzy đều được nạp khi khởi động
+    import fuzzywuzzy.fuzz
+    doc_manager.requests, doc_manager.categories, doc_manager.ratings
+    doc_manager.logs, reader_manager.logs, borrowing_manager.logs
+doc_manager.get_document_details("TL000001")
+print(time.perf_counter() - start)
+"""
+
+
+def write_json(path: str, data):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=4)
+
+
+def make_data(directory: str):
+    random.seed(0)
+    catalog = make_catalog(100_000)
+    write_json(os.path.join(directory, "documents.json"), catalog)
+    write_json(os.path.join(directory, "users.json"), [])
+    write_json(os.path.join(directory, "document_ratings.json"), [{
+        "rating_id": f"R{i}", "doc_id": random.choice(catalog)['doc_id'], "reader_id": "DG00001",
+        "rating": random.randint(1, 5), "comment": "", "timestamp": "2025-04-20T20:48:31", "approved": True
+    } for i in range(200_000)])
+    write_json(os.path.join(directory, "document_requests.json"), [{
+        "request_id": f"Q{i}", "title": "TÀI LIỆU MỚI", "category": "SÁCH", "reader_id": "DG00001",
+        "timestamp": "2025-04-20T20:48:31"
+    } for i in range(10_000)])
+    for name, key in (("document_logs.json", "doc_id"), ("reader_logs.json", "reader_id"),
+                      ("borrowing_logs.json", "record_id")):
+        write_json(os.path.join(directory, name), [{
+            "timestamp": "2025-04-20T20:48:31", "action": "add", key: "TL000001", "details": "Thêm tài liệu"
+        } for _ in range(100_000)])
+
+
+def measure(data: str, eager: bool, repeat: int = 3) -> float:
+    code = PROCESS.format(root=ROOT, data=data, eager=eager)
+    return min(float(subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                                    check=True).stdout.strip().splitlines()[-1]) for _ in range(repeat))
+
+
+def main():
+    with tempfile.TemporaryDirectory() as data:
+        make_data(data)
+        lazy = measure(data, eager=False)
+        eager = measure(data, eager=True)
+    print(f"nạp khi cần (mặc định): {lazy:.3f} s")
+    print(f"nạp toàn bộ (như trước): {eager:.3f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,12 @@
-import json
 import os
+from collections import deque
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Iterable
+from storage import open_store, transactional, WriteBehindFlusher
+from audit_log import AuditLog
+from indexes import DueIndex, StatusIndex
+from sequence import IdSequence
+from search_index import SubstringIndex
 from reader_manager import ReaderManager
 from document_manager import DocumentManager
 
@@ -9,75 +14,186 @@ class BorrowingManager:
     def __init__(self, borrow_file: str = "borrow_records.json", 
                  return_file: str = "return_records.json", 
                  log_file: str = "borrowing_logs.json",
-                 reservation_file: str = "reservation_records.json"):
+                 reservation_file: str = "reservation_records.json",
+                 storage: str = "json", codec: str = "json",
+                 write_behind_ms: Optional[int] = None, snapshot: bool = False):
         self.borrow_file = borrow_file
         self.return_file = return_file
         self.log_file = log_file
         self.reservation_file = reservation_file
+        self.borrow_store = open_store(borrow_file, "borrow_id", storage, codec, snapshot)
+        self.return_store = open_store(return_file, "return_id", storage, codec, snapshot)
+        self.reservation_store = open_store(reservation_file, "reservation_id", storage, codec, snapshot)
+        self.audit_log = AuditLog(log_file)
+        self.borrow_ids = IdSequence(borrow_file, "BR", 5, seed=lambda: (r['borrow_id'] for r in self.borrow_records))
+        self.return_ids = IdSequence(return_file, "RT", 5, seed=lambda: (r['return_id'] for r in self.return_records))
+        self.reservation_ids = IdSequence(reservation_file, "RS", 5,
+                                          seed=lambda: (r['reservation_id'] for r in self.reservation_records))
         self.borrow_records = self._load_borrow_records()
         self.return_records = self._load_return_records()
-        self.logs = self._load_logs()
         self.reservation_records = self._load_reservation_records()
+        self._rebuild_indexes()
+        self.flusher = WriteBehindFlusher(self, write_behind_ms) if write_behind_ms else None
 
     def _load_borrow_records(self) -> List[Dict]:
         try:
-            with open(self.borrow_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return self.borrow_store.load()
         except FileNotFoundError:
             os.makedirs(os.path.dirname(self.borrow_file), exist_ok=True)
-            with open(self.borrow_file, 'w', encoding='utf-8') as f:
-                json.dump([], f, ensure_ascii=False, indent=4)
+            self.borrow_store.save([])
             return []
 
     def _load_return_records(self) -> List[Dict]:
         try:
-            with open(self.return_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return self.return_store.load()
         except FileNotFoundError:
             os.makedirs(os.path.dirname(self.return_file), exist_ok=True)
-            with open(self.return_file, 'w', encoding='utf-8') as f:
-                json.dump([], f, ensure_ascii=False, indent=4)
+            self.return_store.save([])
             return []
 
-    def _load_logs(self) -> List[Dict]:
-        try:
-            with open(self.log_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except FileNotFoundError:
-            os.makedirs(os.path.dirname(self.log_file), exist_ok=True)
-            with open(self.log_file, 'w', encoding='utf-8') as f:
-                json.dump([], f, ensure_ascii=False, indent=4)
-            return []
+    @property
+    def logs(self) -> List[Dict]:
+        # Lịch sử thao tác chỉ được đọc từ đĩa khi thật sự cần
+        return list(self.audit_log.entries())
 
     def _load_reservation_records(self) -> List[Dict]:
         try:
-            with open(self.reservation_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return self.reservation_store.load()
         except FileNotFoundError:
             os.makedirs(os.path.dirname(self.reservation_file), exist_ok=True)
-            with open(self.reservation_file, 'w', encoding='utf-8') as f:
-                json.dump([], f, ensure_ascii=False, indent=4)
+            self.reservation_store.save([])
             return []
 
-    def _save_borrow_records(self):
+    def _save_borrow_records(self, *changed: Dict, deleted: Iterable[str] = ()):
         os.makedirs(os.path.dirname(self.borrow_file), exist_ok=True)
-        with open(self.borrow_file, 'w', encoding='utf-8') as f:
-            json.dump(self.borrow_records, f, ensure_ascii=False, indent=4)
-
-    def _save_return_records(self):
+        self.borrow_store.save(self.borrow_records, changed or None, deleted)
+        # Mọi thay đổi phiếu mượn đều đi qua đây nên chỉ mục trạng thái và hạn trả được cập nhật tại chỗ này
+        if not changed and not deleted:
+            self._rebuild_borrow_tracking()
+        for record in changed:
+            self._track_borrow(record)
+        for borrow_id in deleted:
+            self._borrow_status.discard(borrow_id)
+            self._due_index.discard(borrow_id)
+
+    def _save_return_records(self, *changed: Dict, deleted: Iterable[str] = ()):
         os.makedirs(os.path.dirname(self.return_file), exist_ok=True)
-        with open(self.return_file, 'w', encoding='utf-8') as f:
-            json.dump(self.return_records, f, ensure_ascii=False, indent=4)
-
-    def _save_logs(self):
-        os.makedirs(os.path.dirname(self.log_file), exist_ok=True)
-        with open(self.log_file, 'w', encoding='utf-8') as f:
-            json.dump(self.logs, f, ensure_ascii=False, indent=4)
+        self.return_store.save(self.return_records, changed or None, deleted)
 
-    def _save_reservation_records(self):
+    def _save_reservation_records(self, *changed: Dict, deleted: Iterable[str] = ()):
         os.makedirs(os.path.dirname(self.reservation_file), exist_ok=True)
-        with open(self.reservation_file, 'w', encoding='utf-8') as f:
-            json.dump(self.reservation_records, f, ensure_ascii=False, indent=4)
+        self.reservation_store.save(self.reservation_records, changed or None, deleted)
+        if not changed:
+            self._rebuild_reservation_tracking()
+        for reservation in changed:
+            self._track_reservation(reservation)
+
+    def _stores(self) -> List[tuple]:
+        return [("borrow_records", self.borrow_store), ("return_records", self.return_store),
+                ("reservation_records", self.reservation_store)]
+
+    def _reload(self):
+        self.borrow_records = self._load_borrow_records()
+        self.return_records = self._load_return_records()
+        self.reservation_records = self._load_reservation_records()
+        self._rebuild_indexes()
+
+    def _rebuild_indexes(self):
+        self._borrow_by_id = {}
+        self._return_by_id = {}
+        self._reservation_by_id = {}
+        # Vị trí của phiếu mượn / đặt trước trong danh sách (chỉ thêm vào cuối, không dùng lại khi xóa)
+        # để các nhóm trạng thái giữ đúng thứ tự danh sách
+        self._borrow_positions = {}
+        self._reservation_positions = {}
+        # Chỉ mục trigram cho tìm kiếm theo một phần mã
+        self._borrow_search = SubstringIndex('borrow_id', ('borrow_id', 'reader_id'))
+        self._return_search = SubstringIndex('return_id', ('return_id', 'borrow_id', 'reader_id'))
+        for record in self.borrow_records:
+            self._index_borrow(record)
+        self._rebuild_borrow_tracking()
+        for record in self.return_records:
+            self._index_return(record)
+        for reservation in self.reservation_records:
+            self._index_reservation(reservation)
+        self._rebuild_reservation_tracking()
+
+    def _rebuild_borrow_tracking(self):
+        self._borrow_status = StatusIndex('borrow_id')
+        self._due_index = DueIndex()
+        for record in self.borrow_records:
+            self._track_borrow(record)
+
+    def _track_borrow(self, record: Dict):
+        if self._borrow_by_id.get(record['borrow_id']) is not record:
+            return
+        self._borrow_status.track(record, self._borrow_positions[record['borrow_id']])
+        if record['status'] == 'borrowed':
+            self._due_index.add(record['borrow_id'], record['due_date'], record)
+        else:
+            self._due_index.discard(record['borrow_id'])
+
+    def _rebuild_reservation_tracking(self):
+        # Nhóm đặt trước theo trạng thái, hàng đợi FIFO các đặt trước đang chờ theo tài liệu
+        # và số đặt trước đang chờ theo độc giả
+        self._reservation_status = StatusIndex('reservation_id')
+        self._reservation_queues = {}
+        self._pending_per_reader = {}
+        self._queued = set()
+        reservations = [res for res in self.reservation_records
+                        if self._reservation_by_id.get(res['reservation_id']) is res]
+        for reservation in sorted(reservations, key=lambda res: res['reservation_date']):
+            self._track_reservation(reservation)
+
+    def _track_reservation(self, reservation: Dict):
+        reservation_id = reservation['reservation_id']
+        if self._reservation_by_id.get(reservation_id) is not reservation:
+            return
+        self._reservation_status.track(reservation, self._reservation_positions[reservation_id])
+        pending = reservation['status'] == 'pending'
+        if pending == (reservation_id in self._queued):
+            return
+        doc_id = reservation['doc_id']
+        reader_id = reservation['reader_id']
+        if pending:
+            self._reservation_queues.setdefault(doc_id, deque()).append(reservation)
+            self._queued.add(reservation_id)
+            self._pending_per_reader[reader_id] = self._pending_per_reader.get(reader_id, 0) + 1
+            return
+
+        queue = self._reservation_queues[doc_id]
+        if queue[0] is reservation:
+            queue.popleft()
+        else:
+            del queue[next(i for i, res in enumerate(queue) if res is reservation)]
+        if not queue:
+            del self._reservation_queues[doc_id]
+        self._queued.discard(reservation_id)
+        self._pending_per_reader[reader_id] -= 1
+        if not self._pending_per_reader[reader_id]:
+            del self._pending_per_reader[reader_id]
+
+    # Giữ bản ghi đầu tiên nếu trùng mã, giống như tìm tuần tự trước đây
+    def _index_borrow(self, record: Dict):
+        if self._borrow_by_id.setdefault(record['borrow_id'], record) is record:
+            self._borrow_positions[record['borrow_id']] = len(self._borrow_positions)
+        self._borrow_search.add(record)
+
+    def _index_return(self, record: Dict):
+        self._return_by_id.setdefault(record['return_id'], record)
+        self._return_search.add(record)
+
+    def _index_reservation(self, reservation: Dict):
+        if self._reservation_by_id.setdefault(reservation['reservation_id'], reservation) is reservation:
+            self._reservation_positions[reservation['reservation_id']] = len(self._reservation_positions)
+
+    def close(self):
+        if self.flusher is not None:
+            self.flusher.close()
+        self.borrow_store.close(self.borrow_records)
+        self.return_store.close(self.return_records)
+        self.reservation_store.close(self.reservation_records)
+        self.audit_log.close()
 
     def _log_action(self, action: str, record_id: str, details: str):
         log_entry = {
@@ -86,18 +202,18 @@ class BorrowingManager:
             "record_id": record_id,
             "details": details
         }
-        self.logs.append(log_entry)
-        self._save_logs()
+        self.audit_log.append(log_entry)
 
     def _generate_borrow_id(self) -> str:
-        return f"BR{str(len(self.borrow_records) + 1).zfill(5)}"
+        return self.borrow_ids.next()
 
     def _generate_return_id(self) -> str:
-        return f"RT{str(len(self.return_records) + 1).zfill(5)}"
+        return self.return_ids.next()
 
     def _generate_reservation_id(self) -> str:
-        return f"RS{str(len(self.reservation_records) + 1).zfill(5)}"
+        return self.reservation_ids.next()
 
+    @transactional
     def create_borrow_record(self, reader_id: str, doc_ids: List[str], 
                             reader_manager: ReaderManager, 
                             doc_manager: DocumentManager) -> Dict:
@@ -148,47 +264,48 @@ class BorrowingManager:
             "status": "borrowed"
         }
         self.borrow_records.append(borrow_record)
-        self._save_borrow_records()
+        self._index_borrow(borrow_record)
+        self._save_borrow_records(borrow_record)
         self._log_action("create_borrow", borrow_id, f"Lập phiếu mượn cho độc giả {reader_id}")
         return borrow_record
 
     def search_borrow_records(self, borrow_id: Optional[str] = None, 
                              reader_id: Optional[str] = None) -> List[Dict]:
         results = []
-        for record in self.borrow_records:
-            match = True
-            if borrow_id and borrow_id.lower() not in record['borrow_id'].lower():
-                match = False
-            if reader_id and reader_id.lower() not in record['reader_id'].lower():
-                match = False
-            if match:
-                results.append({
-                    "stt": len(results) + 1,
-                    "borrow_id": record['borrow_id'],
-                    "reader_id": record['reader_id'],
-                    "borrow_date": record['borrow_date'],
-                    "due_date": record['due_date'],
-                    "quantity": record['quantity'],
-                    "status": record['status']
-                })
+        for record in self._borrow_search.search(borrow_id=borrow_id, reader_id=reader_id):
+            results.append({
+                "stt": len(results) + 1,
+                "borrow_id": record['borrow_id'],
+                "reader_id": record['reader_id'],
+                "borrow_date": record['borrow_date'],
+                "due_date": record['due_date'],
+                "quantity": record['quantity'],
+                "status": record['status']
+            })
         return results
 
     def get_overdue_borrow_records(self) -> List[Dict]:
-        overdue_records = []
-        for record in self.borrow_records:
-            if record['status'] == 'borrowed':
-                due_date = datetime.fromisoformat(record['due_date'])
-                if due_date < datetime.now():
-                    overdue_records.append({
-                        "stt": len(overdue_records) + 1,
-                        "borrow_id": record['borrow_id'],
-                        "reader_id": record['reader_id'],
-                        "borrow_date": record['borrow_date'],
-                        "due_date": record['due_date'],
-                        "quantity": record['quantity'],
-                        "status": record['status']
-                    })
-        return overdue_records
+        # Chỉ duyệt các phiếu đã quá hạn, hạn sớm nhất trước
+        return self._format_due_records(self._due_index.before(datetime.now()))
+
+    def get_due_soon_borrow_records(self, days: int = 3) -> List[Dict]:
+        """
+        Các phiếu mượn chưa quá hạn nhưng sẽ đến hạn trong vòng days ngày tới (dùng để nhắc trả)
+        """
+        if days < 0:
+            raise ValueError("Số ngày phải không âm")
+        return self._format_due_records(self._due_index.due_within(days))
+
+    def _format_due_records(self, records: List[Dict]) -> List[Dict]:
+        return [{
+            "stt": idx + 1,
+            "borrow_id": record['borrow_id'],
+            "reader_id": record['reader_id'],
+            "borrow_date": record['borrow_date'],
+            "due_date": record['due_date'],
+            "quantity": record['quantity'],
+            "status": record['status']
+        } for idx, record in enumerate(records)]
 
     def get_unreturned_borrow_records(self) -> List[Dict]:
         return [{
@@ -199,11 +316,12 @@ class BorrowingManager:
             "due_date": record['due_date'],
             "quantity": record['quantity'],
             "status": record['status']
-        } for idx, record in enumerate(self.borrow_records) if record['status'] == 'borrowed']
+        } for idx, record in enumerate(self._borrow_status.get('borrowed'))]
 
     def get_borrow_record_details(self, borrow_id: str) -> Optional[Dict]:
-        return next((record for record in self.borrow_records if record['borrow_id'] == borrow_id), None)
+        return self._borrow_by_id.get(borrow_id)
 
+    @transactional
     def update_borrow_record(self, borrow_id: str, new_doc_ids: List[str], 
                             reader_manager: ReaderManager, 
                             doc_manager: DocumentManager) -> bool:
@@ -225,11 +343,10 @@ class BorrowingManager:
 
         old_doc_ids = record['documents']
         for doc_id in old_doc_ids:
-            for borrow_record in reader['borrow_history']:
-                if borrow_record['book_id'] == doc_id and borrow_record['status'] == 'borrowed':
-                    borrow_record['status'] = 'cancelled'
-                    reader['borrowed_books'] -= 1
-                    break
+            loan = reader_manager.find_active_loan(reader, doc_id)
+            if loan is not None:
+                reader_manager.set_loan_status(reader, loan, 'cancelled')
+                reader['borrowed_books'] -= 1
             doc_manager.return_document(doc_id)
 
         documents = []
@@ -250,11 +367,12 @@ class BorrowingManager:
 
         record['documents'] = new_doc_ids
         record['quantity'] = len(new_doc_ids)
-        reader_manager._save_readers()
-        self._save_borrow_records()
+        reader_manager._save_readers(reader)
+        self._save_borrow_records(record)
         self._log_action("update_borrow", borrow_id, f"Cập nhật phiếu mượn cho độc giả {record['reader_id']}")
         return True
 
+    @transactional
     def delete_borrow_record(self, borrow_id: str, 
                             reader_manager: ReaderManager, 
                             doc_manager: DocumentManager) -> bool:
@@ -270,20 +388,21 @@ class BorrowingManager:
             raise ValueError("Không tìm thấy độc giả")
 
         for doc_id in record['documents']:
-            for borrow_record in reader['borrow_history']:
-                if borrow_record['book_id'] == doc_id and borrow_record['status'] == 'borrowed':
-                    borrow_record['status'] = 'cancelled'
-                    reader['borrowed_books'] -= 1
-                    break
+            loan = reader_manager.find_active_loan(reader, doc_id)
+            if loan is not None:
+                reader_manager.set_loan_status(reader, loan, 'cancelled')
+                reader['borrowed_books'] -= 1
             doc_manager.return_document(doc_id)
 
         self.borrow_records = [r for r in self.borrow_records if r['borrow_id'] != borrow_id]
-        reader_manager._save_readers()
-        doc_manager._save_documents()
-        self._save_borrow_records()
+        self._borrow_by_id.pop(borrow_id, None)
+        self._borrow_search.discard(record)
+        reader_manager._save_readers(reader)
+        self._save_borrow_records(deleted=[borrow_id])
         self._log_action("delete_borrow", borrow_id, f"Xóa phiếu mượn cho độc giả {record['reader_id']}")
         return True
 
+    @transactional
     def create_return_record(self, borrow_id: str, doc_ids: List[str], 
                             reader_manager: ReaderManager, 
                             doc_manager: DocumentManager) -> Dict:
@@ -325,10 +444,10 @@ class BorrowingManager:
             "total_fine": total_fine
         }
         self.return_records.append(return_record)
-        reader_manager._save_readers()
-        doc_manager._save_documents()
-        self._save_borrow_records()
-        self._save_return_records()
+        self._index_return(return_record)
+        reader_manager._save_readers(reader)
+        self._save_borrow_records(borrow_record)
+        self._save_return_records(return_record)
         self._log_action("create_return", return_id, f"Lập phiếu trả cho phiếu mượn {borrow_id}, Phí phạt: {total_fine} VNĐ")
         return return_record
 
@@ -336,23 +455,15 @@ class BorrowingManager:
                              borrow_id: Optional[str] = None, 
                              reader_id: Optional[str] = None) -> List[Dict]:
         results = []
-        for record in self.return_records:
-            match = True
-            if return_id and return_id.lower() not in record['return_id'].lower():
-                match = False
-            if borrow_id and borrow_id.lower() not in record['borrow_id'].lower():
-                match = False
-            if reader_id and reader_id.lower() not in record['reader_id'].lower():
-                match = False
-            if match:
-                results.append({
-                    "stt": len(results) + 1,
-                    "return_id": record['return_id'],
-                    "borrow_id": record['borrow_id'],
-                    "reader_id": record['reader_id'],
-                    "return_date": record['return_date'],
-                    "total_fine": record['total_fine']
-                })
+        for record in self._return_search.search(return_id=return_id, borrow_id=borrow_id, reader_id=reader_id):
+            results.append({
+                "stt": len(results) + 1,
+                "return_id": record['return_id'],
+                "borrow_id": record['borrow_id'],
+                "reader_id": record['reader_id'],
+                "return_date": record['return_date'],
+                "total_fine": record['total_fine']
+            })
         return results
 
     def get_all_return_records(self) -> List[Dict]:
@@ -366,8 +477,9 @@ class BorrowingManager:
         } for idx, record in enumerate(self.return_records)]
 
     def get_return_record_details(self, return_id: str) -> Optional[Dict]:
-        return next((record for record in self.return_records if record['return_id'] == return_id), None)
+        return self._return_by_id.get(return_id)
 
+    @transactional
     def update_return_record(self, return_id: str, new_doc_ids: List[str], 
                             reader_manager: ReaderManager, 
                             doc_manager: DocumentManager) -> bool:
@@ -386,8 +498,8 @@ class BorrowingManager:
         old_doc_ids = return_record['documents']
         for doc_id in old_doc_ids:
             for history in reader['borrow_history']:
-                if history['book_id'] == doc_id and history['status'] == 'returned':
-                    history['status'] = 'borrowed'
+                if history.get('book_id') == doc_id and history['status'] == 'returned':
+                    reader_manager.set_loan_status(reader, history, 'borrowed')
                     reader['borrowed_books'] += 1
                     reader['fine_amount'] -= history['fine']
                     break
@@ -412,13 +524,13 @@ class BorrowingManager:
 
         return_record['documents'] = new_doc_ids
         return_record['total_fine'] = total_fine
-        reader_manager._save_readers()
-        doc_manager._save_documents()
-        self._save_borrow_records()
-        self._save_return_records()
+        reader_manager._save_readers(reader)
+        self._save_borrow_records(borrow_record)
+        self._save_return_records(return_record)
         self._log_action("update_return", return_id, f"Cập nhật phiếu trả cho phiếu mượn {return_record['borrow_id']}")
         return True
 
+    @transactional
     def delete_return_record(self, return_id: str, 
                             reader_manager: ReaderManager, 
                             doc_manager: DocumentManager) -> bool:
@@ -436,8 +548,8 @@ class BorrowingManager:
 
         for doc_id in return_record['documents']:
             for history in reader['borrow_history']:
-                if history['book_id'] == doc_id and history['status'] == 'returned':
-                    history['status'] = 'borrowed'
+                if history.get('book_id') == doc_id and history['status'] == 'returned':
+                    reader_manager.set_loan_status(reader, history, 'borrowed')
                     reader['borrowed_books'] += 1
                     reader['fine_amount'] -= history['fine']
                     break
@@ -445,13 +557,15 @@ class BorrowingManager:
 
         borrow_record['status'] = 'borrowed'
         self.return_records = [r for r in self.return_records if r['return_id'] != return_id]
-        reader_manager._save_readers()
-        doc_manager._save_documents()
-        self._save_borrow_records()
-        self._save_return_records()
+        self._return_by_id.pop(return_id, None)
+        self._return_search.discard(return_record)
+        reader_manager._save_readers(reader)
+        self._save_borrow_records(borrow_record)
+        self._save_return_records(deleted=[return_id])
         self._log_action("delete_return", return_id, f"Xóa phiếu trả cho phiếu mượn {return_record['borrow_id']}")
         return True
 
+    @transactional
     def extend_borrow_period(self, borrow_id: str, reader_manager: ReaderManager) -> bool:
         borrow_record = self.get_borrow_record_details(borrow_id)
         if not borrow_record:
@@ -461,33 +575,31 @@ class BorrowingManager:
             raise ValueError("Chỉ có thể gia hạn phiếu mượn đang hoạt động")
 
         for doc_id in borrow_record['documents']:
-            if any(res['doc_id'] == doc_id and res['status'] == 'pending' 
-                  for res in self.reservation_records):
+            if doc_id in self._reservation_queues:
                 raise ValueError(f"Không thể gia hạn vì tài liệu {doc_id} có người đặt trước")
 
         reader = reader_manager.get_reader_details(borrow_record['reader_id'])
         if not reader:
             raise ValueError("Không tìm thấy độc giả")
 
-        for history in reader['borrow_history']:
-            if history['book_id'] in borrow_record['documents'] and history.get('extended', False):
-                raise ValueError("Đã gia hạn mượn tài liệu này trước đó")
+        loans = [reader_manager.find_active_loan(reader, doc_id) for doc_id in borrow_record['documents']]
+        loans = [loan for loan in loans if loan is not None]
+        if any(loan.get('extended', False) for loan in loans):
+            raise ValueError("Đã gia hạn mượn tài liệu này trước đó")
 
         new_due_date = (datetime.fromisoformat(borrow_record['due_date']) + timedelta(days=7)).isoformat()
         borrow_record['due_date'] = new_due_date
 
-        for doc_id in borrow_record['documents']:
-            for history in reader['borrow_history']:
-                if history['book_id'] == doc_id and history['status'] == 'borrowed':
-                    history['due_date'] = new_due_date
-                    history['extended'] = True
-                    break
+        for loan in loans:
+            reader_manager.set_loan_due_date(reader, loan, new_due_date)
+            loan['extended'] = True
 
-        self._save_borrow_records()
-        reader_manager._save_readers()
+        self._save_borrow_records(borrow_record)
+        reader_manager._save_readers(reader)
         self._log_action("extend_borrow", borrow_id, f"Gia hạn mượn đến {new_due_date}")
         return True
 
+    @transactional
     def create_reservation(self, reader_id: str, doc_id: str, 
                           reader_manager: ReaderManager, 
                           doc_manager: DocumentManager) -> Dict:
@@ -495,9 +607,7 @@ class BorrowingManager:
         if not reader:
             raise ValueError("Không tìm thấy độc giả")
 
-        current_reservations = sum(1 for res in self.reservation_records 
-                                 if res['reader_id'] == reader_id and res['status'] == 'pending')
-        if current_reservations >= 2:
+        if self._pending_per_reader.get(reader_id, 0) >= 2:
             raise ValueError("Mỗi độc giả chỉ được đặt trước tối đa 2 tài liệu")
 
         document = doc_manager.get_document_details(doc_id)
@@ -507,12 +617,10 @@ class BorrowingManager:
         if document['status'] == 'available':
             raise ValueError("Không thể đặt trước tài liệu đang có sẵn")
 
-        if any(hist['book_id'] == doc_id and hist['status'] == 'borrowed' 
-              for hist in reader['borrow_history']):
+        if reader_manager.find_active_loan(reader, doc_id) is not None:
             raise ValueError("Bạn đang mượn tài liệu này, không thể đặt trước")
 
-        if any(res['doc_id'] == doc_id and res['status'] == 'pending' 
-              for res in self.reservation_records):
+        if doc_id in self._reservation_queues:
             raise ValueError("Tài liệu này đã có người đặt trước")
 
         reservation = {
@@ -526,14 +634,15 @@ class BorrowingManager:
         }
 
         self.reservation_records.append(reservation)
-        self._save_reservation_records()
+        self._index_reservation(reservation)
+        self._save_reservation_records(reservation)
         self._log_action("create_reservation", reservation['reservation_id'], 
                          f"Đặt trước tài liệu {doc_id} bởi độc giả {reader_id}")
         return reservation
 
+    @transactional
     def cancel_reservation(self, reservation_id: str) -> bool:
-        reservation = next((res for res in self.reservation_records 
-                          if res['reservation_id'] == reservation_id), None)
+        reservation = self._reservation_by_id.get(reservation_id)
         if not reservation:
             return False
 
@@ -541,49 +650,48 @@ class BorrowingManager:
             raise ValueError("Chỉ có thể hủy đặt trước đang chờ")
 
         reservation['status'] = 'cancelled'
-        self._save_reservation_records()
+        self._save_reservation_records(reservation)
         self._log_action("cancel_reservation", reservation_id, 
                         f"Hủy đặt trước tài liệu {reservation['doc_id']}")
         return True
 
-    def check_reservation_availability(self, doc_id: str) -> bool:
-        document = next((doc for doc in self.documents if doc['doc_id'] == doc_id), None)
+    @transactional
+    def check_reservation_availability(self, doc_id: str, doc_manager: DocumentManager) -> bool:
+        document = doc_manager.get_document_details(doc_id)
         if not document:
             return False
 
         if document['status'] != 'available':
             return False
 
-        pending_reservations = [res for res in self.reservation_records 
-                              if res['doc_id'] == doc_id and res['status'] == 'pending']
-        if not pending_reservations:
+        queue = self._reservation_queues.get(doc_id)
+        if not queue:
             return False
 
-        pending_reservations.sort(key=lambda x: x['reservation_date'])
-
-        first_reservation = pending_reservations[0]
+        # Đặt trước đến sớm nhất được chuyển sang sẵn sàng và rời khỏi hàng đợi khi lưu
+        first_reservation = queue[0]
         first_reservation['status'] = 'ready'
         first_reservation['expiry_date'] = (datetime.now() + timedelta(days=3)).isoformat()
-        self._save_reservation_records()
+        self._save_reservation_records(first_reservation)
         return True
 
     def get_pending_reservations(self, reader_id: Optional[str] = None) -> List[Dict]:
-        results = [res for res in self.reservation_records if res['status'] == 'pending']
+        results = self._reservation_status.get('pending')
         if reader_id:
             results = [res for res in results if res['reader_id'] == reader_id]
         return results
 
     def get_ready_reservations(self, reader_id: Optional[str] = None) -> List[Dict]:
-        results = [res for res in self.reservation_records if res['status'] == 'ready']
+        results = self._reservation_status.get('ready')
         if reader_id:
             results = [res for res in results if res['reader_id'] == reader_id]
         return results
 
+    @transactional
     def complete_reservation(self, reservation_id: str, 
                             reader_manager: ReaderManager, 
                             doc_manager: DocumentManager) -> bool:
-        reservation = next((res for res in self.reservation_records 
-                          if res['reservation_id'] == reservation_id), None)
+        reservation = self._reservation_by_id.get(reservation_id)
         if not reservation:
             return False
 
@@ -602,14 +710,14 @@ class BorrowingManager:
         )
 
         reservation['status'] = 'completed'
-        self._save_reservation_records()
+        self._save_reservation_records(reservation)
         self._log_action("complete_reservation", reservation_id, 
                         f"Hoàn tất đặt trước, tài liệu {reservation['doc_id']} đã được mượn")
         return True
 
+    @transactional
     def notify_ready_reservations(self):
-        ready_reservations = [res for res in self.reservation_records 
-                            if res['status'] == 'ready' and not res['notified']]
+        ready_reservations = [res for res in self._reservation_status.get('ready') if not res['notified']]
         
         for res in ready_reservations:
             res['notified'] = True
@@ -617,4 +725,4 @@ class BorrowingManager:
                             f"Đã thông báo tài liệu {res['doc_id']} sẵn sàng cho độc giả {res['reader_id']}")
 
         if ready_reservations:
-            self._save_reservation_records()
\ No newline at end of file
+            self._save_reservation_records(*ready_reservations)
\ No newline at end of file
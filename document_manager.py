@@ -1,49 +1,99 @@
+import bisect
 import json
 import uuid
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional, Union
-from fuzzywuzzy import fuzz
+from typing import List, Dict, Optional, Union, Iterable, Iterator
+from storage import open_store, transactional, WriteBehindFlusher
+from audit_log import AuditLog
+from sequence import IdSequence
+from search_index import SubstringIndex, FuzzyShortlist, SearchCache, BatchMatcher, search_key, top_k
 
 class DocumentManager:
     def __init__(self, documents_file: str, requests_file: str = "document_requests.json", 
                  log_file: str = "document_logs.json", categories_file: str = "document_categories.json",
-                 ratings_file: str = "document_ratings.json"):
+                 ratings_file: str = "document_ratings.json", storage: str = "json",
+                 codec: str = "json", write_behind_ms: Optional[int] = None,
+                 snapshot: bool = False, search_cache_size: int = 256):
         self.documents_file = documents_file
         self.requests_file = requests_file
         self.log_file = log_file
         self.categories_file = categories_file
         self.ratings_file = ratings_file
+        self.documents_store = open_store(documents_file, "doc_id", storage, codec, snapshot)
+        self.requests_store = open_store(requests_file, "request_id", storage, codec, snapshot)
+        self.categories_store = open_store(categories_file, "category_id", storage, codec, snapshot)
+        self.ratings_store = open_store(ratings_file, "rating_id", storage, codec, snapshot)
+        self.audit_log = AuditLog(log_file)
+        self.doc_ids = IdSequence(documents_file, "TL", 3, seed=lambda: (d['doc_id'] for d in self.documents))
+        self.category_ids = IdSequence(categories_file, "DM", 3,
+                                       seed=lambda: (c['category_id'] for c in self.categories))
+        # Tăng mỗi khi danh sách tài liệu thay đổi; kết quả tìm kiếm đệm của thế hệ cũ bị bỏ
+        self.generation = 0
+        self.search_cache = SearchCache(search_cache_size)
+        # Pool tiến trình cho match_titles được giữ lại giữa các lần gọi
+        self.batch_matcher = BatchMatcher()
         self.documents = self._load_documents()
-        self.requests = self._load_requests()
-        self.logs = self._load_logs()
-        self.categories = self._load_categories()
-        self.ratings = self._load_ratings()
+        self._rebuild_indexes()
+        # Đề xuất, danh mục và đánh giá ít dùng ở quầy mượn trả nên chỉ nạp khi truy cập lần đầu
+        self._requests = None
+        self._categories = None
+        self._categories_by_name = None
+        self._ratings = None
+        self._rating_stats = None
+        self.flusher = WriteBehindFlusher(self, write_behind_ms) if write_behind_ms else None
+
+    @property
+    def requests(self) -> List[Dict]:
+        if self._requests is None:
+            self._requests = self._load_requests()
+        return self._requests
+
+    @requests.setter
+    def requests(self, value: List[Dict]):
+        self._requests = value
+
+    @property
+    def categories(self) -> List[Dict]:
+        if self._categories is None:
+            self._categories = self._load_categories()
+        return self._categories
+
+    @categories.setter
+    def categories(self, value: List[Dict]):
+        self._categories = value
+        self._categories_by_name = None
+
+    @property
+    def ratings(self) -> List[Dict]:
+        if self._ratings is None:
+            self._ratings = self._load_ratings()
+        return self._ratings
+
+    @ratings.setter
+    def ratings(self, value: List[Dict]):
+        self._ratings = value
+        self._rating_stats = None
 
     def _load_documents(self) -> List[Dict]:
         try:
-            with open(self.documents_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return self.documents_store.load()
         except FileNotFoundError:
             return []
 
     def _load_requests(self) -> List[Dict]:
         try:
-            with open(self.requests_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return self.requests_store.load()
         except FileNotFoundError:
             return []
 
-    def _load_logs(self) -> List[Dict]:
-        try:
-            with open(self.log_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except FileNotFoundError:
-            return []
+    @property
+    def logs(self) -> List[Dict]:
+        # Lịch sử thao tác chỉ được đọc từ đĩa khi thật sự cần
+        return list(self.audit_log.entries())
 
     def _load_categories(self) -> List[Dict]:
         try:
-            with open(self.categories_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return self.categories_store.load()
         except FileNotFoundError:
             # Danh mục mặc định nếu file không tồn tại
             default_categories = [
@@ -56,30 +106,139 @@ class DocumentManager:
 
     def _load_ratings(self) -> List[Dict]:
         try:
-            with open(self.ratings_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return self.ratings_store.load()
         except FileNotFoundError:
             return []
 
-    def _save_documents(self):
-        with open(self.documents_file, 'w', encoding='utf-8') as f:
-            json.dump(self.documents, f, ensure_ascii=False, indent=4)
+    def _save_documents(self, *changed: Dict, deleted: Iterable[str] = ()):
+        # Không truyền bản ghi nào thì ghi lại toàn bộ danh sách
+        self.documents_store.save(self.documents, changed or None, deleted)
+        self.generation += 1
+
+    def _save_requests(self, *changed: Dict, deleted: Iterable[str] = ()):
+        self.requests_store.save(self.requests, changed or None, deleted)
 
-    def _save_requests(self):
-        with open(self.requests_file, 'w', encoding='utf-8') as f:
-            json.dump(self.requests, f, ensure_ascii=False, indent=4)
+    def _save_categories(self, categories: List[Dict], *changed: Dict, deleted: Iterable[str] = ()):
+        self.categories_store.save(categories, changed or None, deleted)
 
-    def _save_logs(self):
-        with open(self.log_file, 'w', encoding='utf-8') as f:
-            json.dump(self.logs, f, ensure_ascii=False, indent=4)
+    def _save_ratings(self, *changed: Dict):
+        self.ratings_store.save(self.ratings, changed or None)
 
-    def _save_categories(self, categories: List[Dict]):
-        with open(self.categories_file, 'w', encoding='utf-8') as f:
-            json.dump(categories, f, ensure_ascii=False, indent=4)
+    def _stores(self) -> List[tuple]:
+        return [("documents", self.documents_store), ("requests", self.requests_store),
+                ("categories", self.categories_store), ("ratings", self.ratings_store)]
 
-    def _save_ratings(self):
-        with open(self.ratings_file, 'w', encoding='utf-8') as f:
-            json.dump(self.ratings, f, ensure_ascii=False, indent=4)
+    def _reload(self):
+        self.documents = self._load_documents()
+        self._rebuild_indexes()
+        self._requests = None
+        self._categories = None
+        self._categories_by_name = None
+        self._ratings = None
+        self._rating_stats = None
+
+    def _rebuild_indexes(self):
+        self.generation += 1
+        self._documents_by_id = {}
+        # Vị trí trong danh sách (tài liệu chỉ được thêm vào cuối, xóa là xóa mềm)
+        # và nhóm tài liệu theo danh mục
+        self._positions = {}
+        self._documents_by_category = {}
+        self._document_search = SubstringIndex('doc_id', ('doc_id',))
+        self._title_shortlist = FuzzyShortlist()
+        # Khóa tìm kiếm (chữ thường, bỏ dấu) của tiêu đề và tên danh mục, tính một lần khi ghi
+        self._title_keys = {}
+        self._category_keys = {}
+        for document in self.documents:
+            self._index_document(document)
+
+    def _index_document(self, document: Dict):
+        # Giữ bản ghi đầu tiên nếu trùng mã, giống như tìm tuần tự trước đây
+        if document['doc_id'] in self._documents_by_id:
+            return
+        self._documents_by_id[document['doc_id']] = document
+        self._positions[document['doc_id']] = len(self._positions)
+        self._documents_by_category.setdefault(document['category'], {})[document['doc_id']] = document
+        self._document_search.add(document)
+        self._index_title(document)
+
+    def _index_title(self, document: Dict):
+        key = search_key(document['title'])
+        self._title_keys[document['doc_id']] = key
+        self._title_shortlist.add(document['doc_id'], key)
+
+    def _category_key(self, name: str) -> str:
+        key = self._category_keys.get(name)
+        if key is None:
+            key = self._category_keys[name] = search_key(name)
+        return key
+
+    def _set_category(self, document: Dict, category: str):
+        members = self._documents_by_category.get(document['category'], {})
+        if members.get(document['doc_id']) is document:
+            del members[document['doc_id']]
+            if not members:
+                del self._documents_by_category[document['category']]
+            self._documents_by_category.setdefault(category, {})[document['doc_id']] = document
+        document['category'] = category
+
+    def _rating_index(self) -> Dict:
+        """
+        Tổng hợp đánh giá theo tài liệu, dựng ở lần dùng đầu tiên rồi cập nhật dần:
+        danh sách đánh giá, số lượng / tổng / phân bố số sao của các đánh giá đã duyệt,
+        và bảng xếp hạng tài liệu theo điểm trung bình giảm dần
+        """
+        if self._rating_stats is None:
+            self._rating_stats = {"by_id": {}, "by_doc": {}, "approved": {}, "ranking": [], "ranked": {}}
+            for rating in self.ratings:
+                self._track_rating(rating)
+        return self._rating_stats
+
+    def _track_rating(self, rating: Dict):
+        index = self._rating_stats
+        if rating['rating_id'] not in index["by_id"]:
+            index["by_id"][rating['rating_id']] = rating
+            index["by_doc"].setdefault(rating['doc_id'], []).append(rating)
+            if rating['approved']:
+                self._apply_rating(rating, 1)
+
+    def _apply_rating(self, rating: Dict, sign: int):
+        # Cộng (sign=1) hoặc trừ (sign=-1) một đánh giá đã duyệt vào tổng hợp của tài liệu
+        index = self._rating_stats
+        doc_id = rating['doc_id']
+        stats = index["approved"].setdefault(doc_id, {"count": 0, "sum": 0, "histogram": [0] * 5})
+        stats["count"] += sign
+        stats["sum"] += sign * rating['rating']
+        stats["histogram"][rating['rating'] - 1] += sign
+
+        ranking = index["ranking"]
+        old_key = index["ranked"].pop(doc_id, None)
+        if old_key is not None:
+            del ranking[bisect.bisect_left(ranking, old_key)]
+        if stats["count"]:
+            # Cùng điểm thì giữ thứ tự tài liệu trong danh mục như khi sắp xếp ổn định trước đây
+            key = (-stats["sum"] / stats["count"], self._positions.get(doc_id, len(self._positions)), doc_id)
+            bisect.insort(ranking, key)
+            index["ranked"][doc_id] = key
+        else:
+            del index["approved"][doc_id]
+
+    def _category_name_index(self) -> Dict[str, Dict]:
+        if self._categories_by_name is None:
+            self._categories_by_name = {}
+            for category in self.categories:
+                self._categories_by_name.setdefault(category['name'].upper(), category)
+        return self._categories_by_name
+
+    def close(self):
+        if self.flusher is not None:
+            self.flusher.close()
+        self.batch_matcher.close()
+        self.documents_store.close(self.documents)
+        self.requests_store.close(self._requests)
+        self.categories_store.close(self._categories)
+        self.ratings_store.close(self._ratings)
+        self.audit_log.close()
 
     def _log_action(self, action: str, doc_id: str, details: str):
         log_entry = {
@@ -88,20 +247,19 @@ class DocumentManager:
             "doc_id": doc_id,
             "details": details
         }
-        self.logs.append(log_entry)
-        self._save_logs()
+        self.audit_log.append(log_entry)
 
     def _generate_doc_id(self) -> str:
-        return f"TL{str(len(self.documents) + 1).zfill(3)}"
+        return self.doc_ids.next()
 
     def _generate_category_id(self) -> str:
-        return f"DM{str(len(self.categories) + 1).zfill(3)}"
+        return self.category_ids.next()
 
     def _check_duplicate_doc_id(self, doc_id: str) -> bool:
-        return any(doc['doc_id'] == doc_id for doc in self.documents)
+        return doc_id in self._documents_by_id
 
     def _check_duplicate_category_name(self, name: str) -> bool:
-        return any(cat['name'].upper() == name.upper() for cat in self.categories)
+        return name.upper() in self._category_name_index()
 
     def _update_status(self, document: Dict):
         """Cập nhật trạng thái tài liệu dựa trên AvailableQuantity."""
@@ -110,6 +268,7 @@ class DocumentManager:
         else:
             document['status'] = "unavailable"
 
+    @transactional
     def add_document(self, title: str, category: str, SoLuong: int, DacBiet: bool = False) -> Dict:
         if not title or not category:
             raise ValueError("Tên tài liệu và lĩnh vực không được để trống")
@@ -130,36 +289,106 @@ class DocumentManager:
             "AvailableQuantity": SoLuong
         }
         self.documents.append(document)
-        self._save_documents()
+        self._index_document(document)
+        self._save_documents(document)
         self._log_action("add", doc_id, f"Thêm tài liệu: {title}")
         return document
 
+    def _scored_documents(self, doc_id: Optional[str], title: Optional[str], category: Optional[str],
+                          min_similarity: int) -> Iterator[tuple]:
+        """
+        Sinh (điểm, vị trí, tài liệu) cho các tài liệu khớp, theo thứ tự trong danh mục tài liệu.
+        Không tìm theo tiêu đề thì mọi tài liệu khớp có điểm 100.
+        """
+        if title:
+            # Chỉ nạp thư viện so khớp mờ khi thật sự tìm theo tên
+            from fuzzywuzzy import fuzz
+        # Mã tài liệu được tra qua chỉ mục trigram (theo thứ tự danh mục tài liệu)
+        candidates = self._document_search.search(doc_id=doc_id) if doc_id else self.documents
+        if category:
+            # Lọc theo danh mục qua chỉ mục: chỉ duyệt các tài liệu thuộc danh mục khớp
+            needle = search_key(category)
+            in_category = [doc for name, members in self._documents_by_category.items()
+                           if needle in self._category_key(name) for doc in members.values()]
+            if doc_id:
+                matched_ids = {doc['doc_id'] for doc in candidates}
+                in_category = [doc for doc in in_category if doc['doc_id'] in matched_ids]
+            candidates = sorted(in_category, key=lambda doc: self._positions[doc['doc_id']])
+        if title:
+            query = search_key(title)
+            # Chỉ chấm điểm mờ các tài liệu có đủ bigram chung để có thể đạt min_similarity
+            shortlist = self._title_shortlist.shortlist(query, min_similarity)
+            if shortlist is not None and candidates is self.documents:
+                candidates = sorted((self._documents_by_id[key] for key in shortlist),
+                                    key=lambda doc: self._positions[doc['doc_id']])
+            elif shortlist is not None:
+                candidates = [doc for doc in candidates if doc['doc_id'] in shortlist]
+        for doc in candidates:
+            score = 100
+            if title:
+                score = fuzz.partial_ratio(query, self._title_keys[doc['doc_id']])
+                if score < min_similarity:
+                    continue
+            yield score, self._positions[doc['doc_id']], doc
+
+    @staticmethod
+    def _document_summary(doc: Dict) -> Dict:
+        return {
+            "doc_id": doc['doc_id'],
+            "title": doc['title'],
+            "category": doc['category'],
+            "SoLuong": doc['SoLuong'],
+            "DacBiet": doc['DacBiet'],
+            "status": doc['status'],
+            "AvailableQuantity": doc['AvailableQuantity']
+        }
+
     def search_documents(self, doc_id: Optional[str] = None, title: Optional[str] = None, 
                         category: Optional[str] = None, min_similarity: int = 80) -> List[Dict]:
+        key = ("documents", search_key(doc_id) or None, search_key(title) or None,
+               search_key(category) or None, min_similarity)
+        results = self.search_cache.get(key, self.generation)
+        if results is not None:
+            return results
         results = []
-        for doc in self.documents:
-            match = True
-            if doc_id and doc_id.lower() not in doc['doc_id'].lower():
-                match = False
-            if title:
-                similarity = fuzz.partial_ratio(title.lower(), doc['title'].lower())
-                if similarity < min_similarity:
-                    match = False
-            if category and category.lower() not in doc['category'].lower():
-                match = False
-            if match:
-                results.append({
-                    "stt": len(results) + 1,
-                    "doc_id": doc['doc_id'],
-                    "title": doc['title'],
-                    "category": doc['category'],
-                    "SoLuong": doc['SoLuong'],
-                    "DacBiet": doc['DacBiet'],
-                    "status": doc['status'],
-                    "AvailableQuantity": doc['AvailableQuantity']
-                })
+        for _, _, doc in self._scored_documents(doc_id, title, category, min_similarity):
+            results.append({"stt": len(results) + 1, **self._document_summary(doc)})
+        self.search_cache.put(key, self.generation, results)
         return results
+
+    def rank_documents(self, doc_id: Optional[str] = None, title: Optional[str] = None,
+                       category: Optional[str] = None, min_similarity: int = 80,
+                       limit: int = 20, cursor: Optional[str] = None) -> Dict:
+        """
+        Tìm kiếm xếp hạng: chỉ giữ limit tài liệu có điểm tương đồng cao nhất (kèm điểm "score").
+        Truyền "next_cursor" của trang trước vào cursor để lấy trang kế tiếp.
+        """
+        page, next_cursor = top_k(self._scored_documents(doc_id, title, category, min_similarity), limit, cursor)
+        return {
+            "results": [{**self._document_summary(doc), "score": score} for score, _, doc in page],
+            "next_cursor": next_cursor
+        }
+
+    def match_titles(self, titles: List[str], min_similarity: int = 80, limit: int = 5,
+                     workers: Optional[int] = None) -> List[Dict]:
+        """
+        So khớp mờ hàng loạt nhiều tiêu đề (ví dụ danh sách sách cần mua) với danh mục tài liệu,
+        chia danh mục cho workers tiến trình (mặc định bằng số CPU; lô nhỏ được so khớp ngay trong
+        tiến trình hiện tại). Mỗi tiêu đề nhận tối đa limit tài liệu khớp nhất kèm điểm "score",
+        cùng thứ tự với rank_documents.
+        """
+        by_position = {position: doc_id for doc_id, position in self._positions.items()}
+        entries = [(position, self._title_keys[doc_id]) for position, doc_id in by_position.items()]
+        matches = self.batch_matcher.match([search_key(title) for title in titles], entries, self.generation,
+                                           min_similarity, limit, workers)
+        return [{
+            "query": title,
+            "matches": [{**self._document_summary(self._documents_by_id[by_position[position]]), "score": score}
+                        for score, position in found]
+        } for title, found in zip(titles, matches)]
+
     # thay 
+    @transactional
     def update_document(self, doc_id: str, updates: Dict) -> bool:
         document = self.get_document_details(doc_id)
         if not document:
@@ -188,6 +417,8 @@ class DocumentManager:
             if key in ['SoLuong', 'AvailableQuantity'] and value < 0:
                 raise ValueError("Số lượng không được âm")
 
+        # Chỉ thay đổi tài liệu khi mọi trường đều hợp lệ, để lỗi ở một trường không để lại thay đổi dở dang
+        for key, value in updates.items():
             if key == 'SoLuong':
                 document[key] = value
                 if 'AvailableQuantity' not in updates:
@@ -197,22 +428,26 @@ class DocumentManager:
             elif key == 'title':
                 # Giữ nguyên định dạng tự nhiên của tiêu đề
                 document[key] = value.strip()
+                if self._documents_by_id.get(doc_id) is document:
+                    self._index_title(document)
             elif key == 'category':
                 # Chuẩn hóa category thành chữ hoa
-                document[key] = value.upper().strip()
+                self._set_category(document, value.upper().strip())
             else:
                 document[key] = value
 
         # Cập nhật trạng thái dựa trên AvailableQuantity
         self._update_status(document)
 
+        # Ghi nhận thay đổi trước khi ghi log để lỗi ghi log vẫn được hoàn tác bằng cách nạp lại
+        self._save_documents(document)
+
         # Ghi log chi tiết các thay đổi
         changes = ", ".join(f"{key}: {value}" for key, value in updates.items())
         self._log_action("update", doc_id, f"Cập nhật tài liệu: {document['title']} - Thay đổi: {changes}")
-
-        self._save_documents()
         return True
     #thay doi
+    @transactional
     def delete_document(self, doc_id: str) -> bool:
         document = self.get_document_details(doc_id)
         if not document:
@@ -223,10 +458,11 @@ class DocumentManager:
 
         # Đánh dấu tài liệu là đã xóa
         document['deleted'] = True
-        self._save_documents()
+        self._save_documents(document)
         self._log_action("delete", doc_id, f"Xóa tài liệu: {document['title']}")
         return True
 
+    @transactional
     def request_document(self, title: str, category: str, reader_id: str):
         if not title or not category:
             raise ValueError("Tên tài liệu và lĩnh vực không được để trống")
@@ -239,7 +475,7 @@ class DocumentManager:
             "timestamp": datetime.now().isoformat()
         }
         self.requests.append(request)
-        self._save_requests()
+        self._save_requests(request)
         self._log_action("request", "", f"Yêu cầu tài liệu mới: {title} bởi độc giả {reader_id}")
         return request
 
@@ -266,7 +502,7 @@ class DocumentManager:
             "by_title": {},
             "by_category": {}
         }
-        doc_dict = {doc['doc_id']: doc for doc in self.documents}
+        doc_dict = self._documents_by_id
         for reader in readers:
             for record in reader.get('borrow_history', []):
                 if record['status'] == 'borrowed':
@@ -279,6 +515,7 @@ class DocumentManager:
                         stats['by_category'][category] = stats['by_category'].get(category, 0) + 1
         return stats
 
+    @transactional
     def borrow_document(self, doc_id: str) -> bool:
         document = self.get_document_details(doc_id)
         if not document:
@@ -290,9 +527,10 @@ class DocumentManager:
 
         document['AvailableQuantity'] -= 1
         self._update_status(document)
-        self._save_documents()
+        self._save_documents(document)
         return True
 
+    @transactional
     def return_document(self, doc_id: str) -> bool:
         document = self.get_document_details(doc_id)
         if not document:
@@ -302,13 +540,15 @@ class DocumentManager:
 
         document['AvailableQuantity'] += 1
         self._update_status(document)
-        self._save_documents()
+        self._save_documents(document)
         return True
+    @transactional
     def import_documents_from_json(self, file_path: str) -> Dict[str, Union[int, List[str]]]:
         """
         Nhập tài liệu hàng loạt từ file JSON
         Trả về dict với số lượng thành công, thất bại và danh sách lỗi
         """
+        imported = []
         result = {
             "success": 0,
             "failed": 0,
@@ -328,6 +568,10 @@ class DocumentManager:
             result["errors"].append("Dữ liệu không hợp lệ: phải là mảng các tài liệu")
             return result
 
+        # Cấp trước một khối mã cho các tài liệu chưa có doc_id trong một lần khóa dãy mã
+        missing = sum(1 for doc in documents_to_import if isinstance(doc, dict) and 'doc_id' not in doc)
+        new_ids = iter(self.doc_ids.reserve(missing))
+
         for doc in documents_to_import:
             try:
                 # Kiểm tra các trường bắt buộc
@@ -342,7 +586,7 @@ class DocumentManager:
 
                 # Tạo doc_id mới nếu không có
                 if 'doc_id' not in doc:
-                    doc['doc_id'] = self._generate_doc_id()
+                    doc['doc_id'] = next(new_ids)
 
                 # Chuẩn hóa dữ liệu
                 doc['title'] = doc['title'].upper()
@@ -352,6 +596,8 @@ class DocumentManager:
                 doc['status'] = "available" if doc['SoLuong'] > 0 else "unavailable"
 
                 self.documents.append(doc)
+                self._index_document(doc)
+                imported.append(doc)
                 result["success"] += 1
                 self._log_action("import", doc['doc_id'], f"Nhập tài liệu từ file: {doc['title']}")
 
@@ -360,10 +606,12 @@ class DocumentManager:
                 result["errors"].append(f"Lỗi với tài liệu {doc.get('title', 'Không rõ')}: {str(e)}")
 
         if result["success"] > 0:
-            self._save_documents()
+            self._save_documents(*imported)
+            self.doc_ids.advance_past(doc['doc_id'] for doc in imported)
 
         return result
 
+    @transactional
     def add_category(self, name: str, description: str = "") -> Dict:
         """
         Thêm danh mục mới
@@ -381,10 +629,12 @@ class DocumentManager:
         }
 
         self.categories.append(category)
-        self._save_categories(self.categories)
+        self._category_name_index().setdefault(category['name'], category)
+        self._save_categories(self.categories, category)
         self._log_action("add_category", "", f"Thêm danh mục: {name}")
         return category
 
+    @transactional
     def update_category(self, category_id: str, updates: Dict) -> bool:
         """
         Cập nhật thông tin danh mục
@@ -393,19 +643,33 @@ class DocumentManager:
         if not category:
             return False
 
+        retagged = []
         if 'name' in updates:
             new_name = updates['name'].upper()
             if new_name != category['name'] and self._check_duplicate_category_name(new_name):
                 raise ValueError(f"Danh mục '{new_name}' đã tồn tại")
+            old_name = category['name']
+            if new_name != old_name:
+                # Đổi tên dây chuyền: gắn lại nhãn cho mọi tài liệu thuộc danh mục cũ
+                retagged = list(self._documents_by_category.get(old_name, {}).values())
+                for document in retagged:
+                    self._set_category(document, new_name)
+                names = self._category_name_index()
+                if names.get(old_name.upper()) is category:
+                    del names[old_name.upper()]
+                names.setdefault(new_name, category)
             category['name'] = new_name
 
         if 'description' in updates:
             category['description'] = updates['description']
 
-        self._save_categories(self.categories)
+        self._save_categories(self.categories, category)
+        if retagged:
+            self._save_documents(*retagged)
         self._log_action("update_category", "", f"Cập nhật danh mục: {category['name']}")
         return True
 
+    @transactional
     def delete_category(self, category_id: str) -> bool:
         """
         Xóa danh mục
@@ -415,11 +679,11 @@ class DocumentManager:
             return False
 
         # Kiểm tra xem danh mục có đang được sử dụng không
-        if any(doc['category'] == category['name'] for doc in self.documents):
+        if self._documents_by_category.get(category['name']):
             raise ValueError("Không thể xóa danh mục đang có tài liệu")
 
         self.categories = [cat for cat in self.categories if cat['category_id'] != category_id]
-        self._save_categories(self.categories)
+        self._save_categories(self.categories, deleted=[category_id])
         self._log_action("delete_category", "", f"Xóa danh mục: {category['name']}")
         return True
 
@@ -429,6 +693,7 @@ class DocumentManager:
         """
         return self.categories
 
+    @transactional
     def add_rating(self, doc_id: str, reader_id: str, rating: int, comment: str = "") -> Dict:
         """
         Thêm đánh giá cho tài liệu (1-5 sao)
@@ -451,7 +716,9 @@ class DocumentManager:
         }
 
         self.ratings.append(rating_entry)
-        self._save_ratings()
+        self._rating_index()
+        self._track_rating(rating_entry)
+        self._save_ratings(rating_entry)
         self._log_action("add_rating", doc_id, f"Thêm đánh giá {rating} sao cho tài liệu bởi độc giả {reader_id}")
         return rating_entry
 
@@ -461,7 +728,7 @@ class DocumentManager:
         """
         results = self.ratings
         if doc_id:
-            results = [r for r in results if r['doc_id'] == doc_id]
+            results = self._rating_index()["by_doc"].get(doc_id, [])
         if approved_only:
             results = [r for r in results if r['approved']]
         return results
@@ -470,25 +737,37 @@ class DocumentManager:
         """
         Tính điểm đánh giá trung bình của tài liệu (chỉ tính các đánh giá đã duyệt)
         """
-        ratings = self.get_ratings(doc_id, approved_only=True)
-        if not ratings:
+        stats = self._rating_index()["approved"].get(doc_id)
+        if not stats:
             return None
-        return sum(r['rating'] for r in ratings) / len(ratings)
+        return stats["sum"] / stats["count"]
 
+    def get_rating_distribution(self, doc_id: str) -> Dict[int, int]:
+        """
+        Số đánh giá đã duyệt theo từng mức sao (1-5) của tài liệu
+        """
+        stats = self._rating_index()["approved"].get(doc_id)
+        histogram = stats["histogram"] if stats else [0] * 5
+        return {stars: histogram[stars - 1] for stars in range(1, 6)}
+
+    @transactional
     def approve_rating(self, rating_id: str, approve: bool = True) -> bool:
         """
         Duyệt hoặc từ chối đánh giá
         """
-        rating = next((r for r in self.ratings if r['rating_id'] == rating_id), None)
+        rating = self._rating_index()["by_id"].get(rating_id)
         if not rating:
             return False
 
+        if bool(rating['approved']) != bool(approve):
+            self._apply_rating(rating, 1 if approve else -1)
         rating['approved'] = approve
-        self._save_ratings()
+        self._save_ratings(rating)
         action = "duyệt" if approve else "từ chối"
         self._log_action("approve_rating", rating['doc_id'], f"{action} đánh giá {rating_id}")
         return True
 
+    @transactional
     def approve_document_request(self, request_id: str, approve: bool = True) -> bool:
         """
         Duyệt hoặc từ chối đề xuất tài liệu mới
@@ -513,7 +792,7 @@ class DocumentManager:
 
         # Xóa yêu cầu sau khi xử lý
         self.requests = [req for req in self.requests if req['request_id'] != request_id]
-        self._save_requests()
+        self._save_requests(deleted=[request_id])
         self._log_action("approve_request", "", f"{action_msg}: {request['title']}")
         return True
 
@@ -529,25 +808,27 @@ class DocumentManager:
         """
         return [r for r in self.ratings if not r['approved']]
 
-    def get_recommendations(self, min_rating: float = 4.0, min_reviews: int = 3) -> List[Dict]:
+    def get_recommendations(self, min_rating: float = 4.0, min_reviews: int = 3,
+                            limit: Optional[int] = None) -> List[Dict]:
         """
-        Lấy danh sách tài liệu được đề xuất dựa trên đánh giá
+        Lấy danh sách tài liệu được đề xuất dựa trên đánh giá (tối đa limit tài liệu nếu có)
         """
+        index = self._rating_index()
         recommended = []
-        for doc in self.documents:
-            avg_rating = self.get_average_rating(doc['doc_id'])
-            if avg_rating is None:
+        # Bảng xếp hạng đã sắp theo điểm giảm dần nên dừng ngay khi điểm xuống dưới ngưỡng
+        for neg_avg, _, doc_id in index["ranking"]:
+            if -neg_avg < min_rating or (limit is not None and len(recommended) >= limit):
+                break
+            stats = index["approved"][doc_id]
+            doc = self._documents_by_id.get(doc_id)
+            if doc is None or stats["count"] < min_reviews:
                 continue
-                
-            ratings_count = len(self.get_ratings(doc['doc_id'], approved_only=True))
-            if avg_rating >= min_rating and ratings_count >= min_reviews:
-                doc_copy = doc.copy()
-                doc_copy['average_rating'] = avg_rating
-                doc_copy['rating_count'] = ratings_count
-                recommended.append(doc_copy)
-        
-        # Sắp xếp theo điểm đánh giá giảm dần
-        return sorted(recommended, key=lambda x: x['average_rating'], reverse=True)
+            doc_copy = doc.copy()
+            doc_copy['average_rating'] = stats["sum"] / stats["count"]
+            doc_copy['rating_count'] = stats["count"]
+            recommended.append(doc_copy)
+        return recommended
+    @transactional
     def restore_document(self, doc_id: str) -> bool:
         document = self.get_document_details(doc_id, include_deleted=True)
         if not document:
@@ -558,11 +839,11 @@ class DocumentManager:
     
         document['deleted'] = False
         self._update_status(document)  # Cập nhật trạng thái tài liệu
-        self._save_documents()
+        self._save_documents(document)
         self._log_action("restore", doc_id, f"Khôi phục tài liệu: {document['title']}")
         return True
     def get_document_details(self, doc_id: str, include_deleted: bool = False) -> Optional[Dict]:
-        doc = next((doc for doc in self.documents if doc['doc_id'] == doc_id), None)
+        doc = self._documents_by_id.get(doc_id)
         if not doc:
             self._log_action("get_document_details", doc_id, f"Không tìm thấy tài liệu với doc_id: {doc_id}")
             return None
@@ -0,0 +1,103 @@
+import bisect
+import itertools
+from datetime import datetime, timedelta
+from typing import Any, Dict, Hashable, List, Optional
+
+
+class DueIndex:
+    """
+    Danh sách các lượt mượn đang mở được sắp theo hạn trả.
+    Hạn trả chỉ được phân tích từ chuỗi ISO một lần khi thêm vào, các truy vấn quá hạn /
+    sắp đến hạn chỉ cần tìm nhị phân và duyệt đúng những phần tử thỏa điều kiện.
+    """
+    def __init__(self):
+        self._order: List[tuple] = []
+        self._entries: Dict[Hashable, tuple] = {}
+        self._counter = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def add(self, key: Hashable, due_date: str, item: Any):
+        """
+        Thêm (hoặc cập nhật hạn trả của) một phần tử
+        """
+        self.discard(key)
+        entry = (datetime.fromisoformat(due_date), next(self._counter), key)
+        bisect.insort(self._order, entry)
+        self._entries[key] = (entry, item)
+
+    def discard(self, key: Hashable):
+        found = self._entries.pop(key, None)
+        if found is None:
+            return
+        del self._order[bisect.bisect_left(self._order, found[0])]
+
+    def _items(self, start: int, stop: int) -> List[Any]:
+        return [self._entries[key][1] for _, _, key in self._order[start:stop]]
+
+    def before(self, moment: datetime) -> List[Any]:
+        """
+        Các phần tử có hạn trả trước thời điểm cho trước (đã quá hạn), hạn sớm nhất trước
+        """
+        return self._items(0, bisect.bisect_left(self._order, (moment,)))
+
+    def due_within(self, days: int, now: Optional[datetime] = None) -> List[Any]:
+        """
+        Các phần tử chưa quá hạn nhưng sẽ đến hạn trong vòng days ngày tới
+        """
+        now = now or datetime.now()
+        start = bisect.bisect_left(self._order, (now,))
+        stop = bisect.bisect_left(self._order, (now + timedelta(days=days),))
+        return self._items(start, stop)
+
+
+class StatusIndex:
+    """
+    Phân nhóm bản ghi theo trạng thái (mỗi nhóm giữ thứ tự của bản ghi trong danh sách) để liệt kê
+    các bản ghi đang mở chỉ tốn chi phí tỉ lệ với số kết quả thay vì toàn bộ lịch sử
+    """
+    def __init__(self, key: str):
+        self.key = key
+        self._groups: Dict[str, Dict[Hashable, Dict]] = {}
+        self._status: Dict[Hashable, str] = {}
+        self._positions: Dict[Hashable, int] = {}
+
+    def track(self, record: Dict, position: int):
+        """
+        Ghi nhận trạng thái hiện tại của bản ghi (position: vị trí của bản ghi trong danh sách),
+        chuyển nhóm nếu trạng thái đã đổi
+        """
+        record_id = record[self.key]
+        status = record.get('status')
+        group = self._groups.get(status)
+        if group is not None and group.get(record_id) is record:
+            return
+        self.discard(record_id)
+        if status is None:
+            return
+        group = self._groups.setdefault(status, {})
+        self._status[record_id] = status
+        self._positions[record_id] = position
+        if group and self._positions[next(reversed(group))] > position:
+            # Bản ghi quay lại nhóm cũ: chèn đúng vị trí trong danh sách thay vì nối vào cuối nhóm
+            records = sorted([*group.values(), record], key=lambda item: self._positions[item[self.key]])
+            group.clear()
+            group.update((item[self.key], item) for item in records)
+        else:
+            group[record_id] = record
+
+    def discard(self, record_id: Hashable):
+        status = self._status.pop(record_id, None)
+        if status is not None:
+            del self._groups[status][record_id]
+            del self._positions[record_id]
+
+    def get(self, status: str) -> List[Dict]:
+        return list(self._groups.get(status, {}).values())
+
+    def count(self, status: str) -> int:
+        return len(self._groups.get(status, ()))
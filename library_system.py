@@ -5,13 +5,15 @@ from document_manager import DocumentManager
 from borrowing_manager import BorrowingManager
 
 if __name__ == "__main__":
+    # snapshot=True: khởi động từ bản chụp nhị phân khi nó mới hơn các file JSON
     reader_manager = ReaderManager(
         readers_file=r"E:\Python\library\users.json",
         reader_types_file=r"E:\Python\library\reader_types.json",
-        log_file=r"E:\Python\library\reader_logs.json"
+        log_file=r"E:\Python\library\reader_logs.json",
+        snapshot=True
     )
-    doc_manager = DocumentManager(r"E:\Python\library\documents.json")
-    borrowing_manager = BorrowingManager()
+    doc_manager = DocumentManager(r"E:\Python\library\documents.json", snapshot=True)
+    borrowing_manager = BorrowingManager(snapshot=True)
 
     def get_non_empty_input(prompt: str) -> str:
         while True:
@@ -31,6 +33,21 @@ if __name__ == "__main__":
                 return value
             print("Vui lòng nhập Y hoặc N.")
 
+    def print_ranked_results(rank, title: str, page_size: int = 20, **criteria) -> bool:
+        # In từng trang kết quả tốt nhất thay vì dựng và in toàn bộ danh sách
+        page = rank(limit=page_size, **criteria)
+        if not page["results"]:
+            return False
+        print(f"\n{title}:")
+        shown = 0
+        while True:
+            for result in page["results"]:
+                shown += 1
+                print({"stt": shown, **result})
+            if not page["next_cursor"] or get_yes_no_input(f"Xem thêm {page_size} kết quả? (Y/N): ") == 'n':
+                return True
+            page = rank(limit=page_size, cursor=page["next_cursor"], **criteria)
+
     while True:
         print("\n=== HỆ THỐNG QUẢN LÝ THƯ VIỆN ===")
         print("1. Quản lý độc giả")
@@ -93,12 +110,8 @@ if __name__ == "__main__":
                     id_number = get_optional_input("Nhập CMND/MSSV/MSCB (nhấn Enter nếu không tìm theo số định danh): ")
                     full_name = get_optional_input("Nhập họ tên (nhấn Enter nếu không tìm theo tên): ")
                     email = get_optional_input("Nhập email (nhấn Enter nếu không tìm theo email): ")
-                    results = reader_manager.search_readers(reader_id=reader_id, id_number=id_number, full_name=full_name, email=email)
-                    if results:
-                        print("\nKết quả tìm kiếm:")
-                        for result in results:
-                            print(result)
-                    else:
+                    if not print_ranked_results(reader_manager.rank_readers, "Kết quả tìm kiếm", reader_id=reader_id,
+                                                id_number=id_number, full_name=full_name, email=email):
                         print("Không tìm thấy độc giả phù hợp.")
 
                 elif sub_choice == "3":  # Gia hạn tài khoản
@@ -301,11 +314,8 @@ if __name__ == "__main__":
                     doc_id = get_optional_input("Nhập mã tài liệu (nhấn Enter nếu không tìm theo mã): ")
                     title = get_optional_input("Nhập tiêu đề (nhấn Enter nếu không tìm theo tiêu đề): ")
                     category = get_optional_input("Nhập lĩnh vực (nhấn Enter nếu không tìm theo lĩnh vực): ")
-                    results = doc_manager.search_documents(doc_id=doc_id, title=title, category=category)
-                    if results:
-                        print("\nKết quả tìm kiếm:")
-                        for result in results:
-                            print(result)
+                    if print_ranked_results(doc_manager.rank_documents, "Kết quả tìm kiếm",
+                                            doc_id=doc_id, title=title, category=category):
                         while True:
                             print("\n=== TÙY CHỌN KẾT QUẢ TÌM KIẾM ===")
                             print("1. Xem chi tiết thông tin tài liệu")
@@ -341,12 +351,7 @@ if __name__ == "__main__":
                         print("Không tìm thấy tài liệu phù hợp.")
 
                 elif sub_choice == "3":  
-                    results = doc_manager.search_documents()
-                    if results:
-                        print("\nDanh sách tài liệu:")
-                        for result in results:
-                            print(result)
-                    else:
+                    if not print_ranked_results(doc_manager.rank_documents, "Danh sách tài liệu"):
                         print("Không có tài liệu nào.")
 
                 elif sub_choice == "4": 
@@ -966,6 +971,10 @@ if __name__ == "__main__":
                     print("Lựa chọn không hợp lệ. Vui lòng chọn lại.")
 
         elif choice == "6":  # Thoát
+            # Nén nhật ký ghi trước (nếu có) thành file JSON đầy đủ trước khi thoát
+            reader_manager.close()
+            doc_manager.close()
+            borrowing_manager.close()
             print("Tạm biệt!")
             break
 
@@ -0,0 +1,46 @@
+import argparse
+import json
+import os
+from storage import SqliteStore
+
+# Các file dữ liệu của hệ thống và khóa chính của từng loại bản ghi
+DATA_FILES = {
+    "users.json": "reader_id",
+    "documents.json": "doc_id",
+    "borrow_records.json": "borrow_id",
+    "return_records.json": "return_id",
+    "reservation_records.json": "reservation_id",
+    "document_categories.json": "category_id",
+    "document_ratings.json": "rating_id",
+    "document_requests.json": "request_id",
+}
+
+
+def migrate(data_dir: str, db_file: str = None) -> dict:
+    """
+    Nhập các file JSON trong data_dir vào file SQLite, trả về số bản ghi đã nhập theo từng file
+    """
+    result = {}
+    for file_name, key in DATA_FILES.items():
+        path = os.path.join(data_dir, file_name)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                records = json.load(f)
+        except FileNotFoundError:
+            continue
+
+        store = SqliteStore(path, key, db_file)
+        store.save(records)
+        store.close()
+        result[file_name] = len(records)
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chuyển dữ liệu thư viện từ các file JSON sang SQLite")
+    parser.add_argument("data_dir", nargs="?", default=".", help="Thư mục chứa users.json, documents.json, ...")
+    parser.add_argument("--db", dest="db_file", default=None, help="File SQLite đích (mặc định <data_dir>/library.db)")
+    args = parser.parse_args()
+
+    for file_name, count in migrate(args.data_dir, args.db_file).items():
+        print(f"{file_name}: đã nhập {count} bản ghi")
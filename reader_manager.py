@@ -1,24 +1,61 @@
 import json
+import os
 import re
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional
-from fuzzywuzzy import fuzz
+from typing import List, Dict, Optional, Iterable, Iterator
+from storage import open_store, transactional, DetailsStore, LazyRecord, WriteBehindFlusher
+from serialization import get_codec
+from audit_log import AuditLog
+from indexes import DueIndex
+from sequence import IdSequence
+from search_index import SubstringIndex, FuzzyShortlist, SearchCache, BatchMatcher, search_key, top_k
+
+# Các mảng lịch sử của độc giả, được tách ra file riêng khi bật lazy_details
+DETAIL_FIELDS = ("borrow_history", "notifications", "update_history")
+# Các trường định danh không được trùng giữa hai độc giả
+UNIQUE_KEYS = ("id_card", "student_id", "employee_id", "email")
+
 
 class ReaderManager:
-    def __init__(self, readers_file: str, reader_types_file: str, log_file: str = "reader_logs.json"):
+    def __init__(self, readers_file: str, reader_types_file: str, log_file: str = "reader_logs.json",
+                 storage: str = "json", codec: str = "json", lazy_details: bool = False,
+                 write_behind_ms: Optional[int] = None, snapshot: bool = False,
+                 search_cache_size: int = 256):
         self.readers_file = readers_file
         self.reader_types_file = reader_types_file
         self.log_file = log_file
+        self.readers_store = open_store(readers_file, "reader_id", storage, codec, snapshot)
+        self.details_store = None
+        if lazy_details:
+            self.details_store = DetailsStore(
+                os.path.join(os.path.dirname(readers_file), "reader_details"), "reader_id", DETAIL_FIELDS,
+                get_codec(codec))
+            self.readers_store.project = self.details_store.summary
+        self.audit_log = AuditLog(log_file)
+        self.reader_ids = IdSequence(readers_file, "DG", 5, seed=lambda: (r['reader_id'] for r in self.readers))
+        # Tăng mỗi khi danh sách độc giả thay đổi; kết quả tìm kiếm đệm của thế hệ cũ bị bỏ
+        self.generation = 0
+        self.search_cache = SearchCache(search_cache_size)
+        # Pool tiến trình cho match_names được giữ lại giữa các lần gọi
+        self.batch_matcher = BatchMatcher()
         self.readers = self._load_readers()
         self.reader_types = self._load_reader_types()
-        self.logs = self._load_logs()
+        self._rebuild_indexes()
+        self.flusher = WriteBehindFlusher(self, write_behind_ms) if write_behind_ms else None
 
     def _load_readers(self) -> List[Dict]:
         try:
-            with open(self.readers_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            readers = self.readers_store.load()
         except FileNotFoundError:
             return []
+        if self.details_store is None:
+            return readers
+        # Độc giả còn lưu lịch sử ngay trong file tóm tắt (dữ liệu cũ) được tách ra file chi tiết ngay
+        inline = [reader for reader in readers if any(field in reader for field in DETAIL_FIELDS)]
+        if inline:
+            self.details_store.save(readers, inline)
+        defaults = {"borrow_history": [], "update_history": []}
+        return [LazyRecord(reader, self.details_store, defaults) for reader in readers]
 
     def _load_reader_types(self) -> List[Dict]:
         try:
@@ -27,20 +64,170 @@ class ReaderManager:
         except FileNotFoundError:
             return []
 
-    def _load_logs(self) -> List[Dict]:
-        try:
-            with open(self.log_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except FileNotFoundError:
-            return []
-
-    def _save_readers(self):
-        with open(self.readers_file, 'w', encoding='utf-8') as f:
-            json.dump(self.readers, f, ensure_ascii=False, indent=4)
-
-    def _save_logs(self):
-        with open(self.log_file, 'w', encoding='utf-8') as f:
-            json.dump(self.logs, f, ensure_ascii=False, indent=4)
+    @property
+    def logs(self) -> List[Dict]:
+        # Lịch sử thao tác chỉ được đọc từ đĩa khi thật sự cần
+        return list(self.audit_log.entries())
+
+    def _save_readers(self, *changed: Dict, deleted: Iterable[str] = ()):
+        # Không truyền bản ghi nào thì ghi lại toàn bộ danh sách
+        self.readers_store.save(self.readers, changed or None, deleted)
+        if self.details_store is not None:
+            self.details_store.save(self.readers, changed or None, deleted)
+        self.generation += 1
+
+    def _stores(self) -> List[tuple]:
+        stores = [("readers", self.readers_store)]
+        if self.details_store is not None:
+            stores.append(("readers", self.details_store))
+        return stores
+
+    def _reload(self):
+        self.readers = self._load_readers()
+        self._rebuild_indexes()
+
+    def _rebuild_indexes(self):
+        self.generation += 1
+        self._readers_by_id = {}
+        self._readers_by_key = {key: {} for key in UNIQUE_KEYS}
+        self._reader_search = SubstringIndex('reader_id', ('reader_id', 'email'))
+        # Khóa tìm kiếm (chữ thường, bỏ dấu) của họ tên, tính một lần khi ghi
+        self._name_keys = {}
+        self._name_shortlist = FuzzyShortlist()
+        # Chỉ mục lượt mượn đang mở theo độc giả, dựng dần khi độc giả được truy cập
+        # để không buộc nạp lịch sử mượn của mọi độc giả khi khởi động
+        self._active_loans = {}
+        # Hạn trả của mọi lượt mượn đang mở, chỉ dựng ở lần truy vấn quá hạn đầu tiên
+        self._due_loans = None
+        for reader in self.readers:
+            self._index_reader(reader)
+
+    @staticmethod
+    def _unique_value(key: str, value: Optional[str]) -> Optional[str]:
+        if not value:
+            return None
+        # Email không phân biệt hoa thường
+        return value.lower() if key == "email" else value
+
+    def _index_reader(self, reader: Dict):
+        # Giữ bản ghi đầu tiên nếu trùng mã, giống như tìm tuần tự trước đây
+        if self._readers_by_id.setdefault(reader['reader_id'], reader) is reader:
+            self._index_name(reader)
+        self._index_keys(reader)
+        self._reader_search.add(reader)
+
+    def _unindex_reader(self, reader: Dict):
+        if self._readers_by_id.get(reader['reader_id']) is reader:
+            del self._readers_by_id[reader['reader_id']]
+            del self._name_keys[reader['reader_id']]
+            self._name_shortlist.discard(reader['reader_id'])
+        self._unindex_keys(reader)
+        self._reader_search.discard(reader)
+
+    def _index_name(self, reader: Dict):
+        key = search_key(reader['full_name'])
+        self._name_keys[reader['reader_id']] = key
+        self._name_shortlist.add(reader['reader_id'], key)
+
+    def _reindex_reader(self, reader: Dict, updates: Dict):
+        """
+        Áp dụng thay đổi cho độc giả đang có và cập nhật lại các chỉ mục (giữ nguyên thứ tự)
+        """
+        self._unindex_keys(reader)
+        reader.update(updates)
+        self._index_keys(reader)
+        self._reader_search.add(reader)
+        if self._readers_by_id.get(reader['reader_id']) is reader:
+            self._index_name(reader)
+
+    def _index_keys(self, reader: Dict):
+        for key in UNIQUE_KEYS:
+            value = self._unique_value(key, reader.get(key))
+            if value:
+                self._readers_by_key[key].setdefault(value, reader)
+
+    def _unindex_keys(self, reader: Dict):
+        for key in UNIQUE_KEYS:
+            value = self._unique_value(key, reader.get(key))
+            if value and self._readers_by_key[key].get(value) is reader:
+                del self._readers_by_key[key][value]
+
+    def _loans_of(self, reader: Dict) -> Dict[str, List[Dict]]:
+        loans = self._active_loans.get(reader['reader_id'])
+        if loans is None:
+            loans = {}
+            for record in reader['borrow_history']:
+                # Bỏ qua các mục lịch sử cũ không có book_id
+                if record['status'] == 'borrowed' and record.get('book_id') is not None:
+                    loans.setdefault(record['book_id'], []).append(record)
+            self._active_loans[reader['reader_id']] = loans
+        return loans
+
+    def find_active_loan(self, reader: Dict, book_id: str) -> Optional[Dict]:
+        """
+        Lượt mượn đang mở (cũ nhất) của độc giả đối với một tài liệu
+        """
+        records = self._loans_of(reader).get(book_id)
+        return records[0] if records else None
+
+    def _due_loans_index(self) -> DueIndex:
+        if self._due_loans is None:
+            self._due_loans = DueIndex()
+            for reader in self.readers:
+                for records in self._loans_of(reader).values():
+                    for record in records:
+                        self._due_loans.add(id(record), record['due_date'], (reader, record))
+        return self._due_loans
+
+    def _track_loan_due(self, reader: Dict, record: Dict):
+        if self._due_loans is None:
+            return
+        if record['status'] == 'borrowed':
+            self._due_loans.add(id(record), record['due_date'], (reader, record))
+        else:
+            self._due_loans.discard(id(record))
+
+    def set_loan_due_date(self, reader: Dict, record: Dict, due_date: str):
+        """
+        Đổi hạn trả của một lượt mượn đang mở (khi gia hạn)
+        """
+        record['due_date'] = due_date
+        self._track_loan_due(reader, record)
+
+    def set_loan_status(self, reader: Dict, record: Dict, status: str):
+        """
+        Đổi trạng thái một mục trong lịch sử mượn và cập nhật chỉ mục lượt mượn đang mở
+        """
+        book_id = record.get('book_id')
+        if book_id is None:
+            # Mục lịch sử cũ không có book_id không nằm trong chỉ mục
+            record['status'] = status
+            return
+        loans = self._loans_of(reader)
+        records = [r for r in loans.get(book_id, []) if r is not record]
+        record['status'] = status
+        if status == 'borrowed':
+            records.append(record)
+            if len(records) > 1:
+                # Giữ thứ tự như trong lịch sử mượn để lượt mượn cũ nhất được xử lý trước
+                order = {id(h): i for i, h in enumerate(reader['borrow_history'])}
+                records.sort(key=lambda r: order[id(r)])
+        if records:
+            loans[book_id] = records
+        else:
+            loans.pop(book_id, None)
+        self._track_loan_due(reader, record)
+
+    def _find_by_key(self, key: str, value: Optional[str]) -> Optional[Dict]:
+        value = self._unique_value(key, value)
+        return self._readers_by_key[key].get(value) if value else None
+
+    def close(self):
+        if self.flusher is not None:
+            self.flusher.close()
+        self.batch_matcher.close()
+        self.readers_store.close(self.readers)
+        self.audit_log.close()
 
     def _log_action(self, action: str, reader_id: str, details: str):
         log_entry = {
@@ -49,11 +236,10 @@ class ReaderManager:
             "reader_id": reader_id,
             "details": details
         }
-        self.logs.append(log_entry)
-        self._save_logs()
+        self.audit_log.append(log_entry)
 
     def _generate_reader_id(self) -> str:
-        return f"DG{str(len(self.readers) + 1).zfill(5)}"
+        return self.reader_ids.next()
 
     def _validate_email(self, email: str) -> bool:
         pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
@@ -82,16 +268,15 @@ class ReaderManager:
         except ValueError:
             return False
 
-    def _check_duplicate(self, id_card: str, student_id: Optional[str] = None, employee_id: Optional[str] = None) -> bool:
-        for reader in self.readers:
-            if reader['id_card'] == id_card:
-                return True
-            if student_id and reader.get('student_id') == student_id:
-                return True
-            if employee_id and reader.get('employee_id') == employee_id:
-                return True
-        return False
+    def _check_duplicate(self, id_card: Optional[str], student_id: Optional[str] = None,
+                         employee_id: Optional[str] = None, email: Optional[str] = None,
+                         exclude: Optional[Dict] = None) -> bool:
+        # exclude: độc giả đang được cập nhật, giá trị của chính độc giả đó không tính là trùng
+        values = {"id_card": id_card, "student_id": student_id, "employee_id": employee_id, "email": email}
+        owners = (self._find_by_key(key, value) for key, value in values.items())
+        return any(owner is not None and owner is not exclude for owner in owners)
 
+    @transactional
     def register_reader(self, full_name: str, id_card: str, dob: Optional[str], 
                        phone: str, email: str, address: str, reader_type: str,
                        student_id: Optional[str] = None, employee_id: Optional[str] = None) -> Dict:
@@ -120,8 +305,8 @@ class ReaderManager:
             if not employee_id or not self._validate_employee_id(employee_id):
                 raise ValueError("Mã số cán bộ không hợp lệ")
 
-        if self._check_duplicate(id_card, student_id, employee_id):
-            raise ValueError("CMND, MSSV hoặc MSCB đã tồn tại")
+        if self._check_duplicate(id_card, student_id, employee_id, email):
+            raise ValueError("CMND, MSSV, MSCB hoặc email đã tồn tại")
 
         reader_id = self._generate_reader_id()
         reader_type_info = next(rt for rt in self.reader_types if rt['type'] == reader_type)
@@ -153,50 +338,126 @@ class ReaderManager:
         }
 
         self.readers.append(reader)
-        self._save_readers()
+        self._index_reader(reader)
+        self._save_readers(reader)
         self._log_action("register", reader_id, f"Đăng ký độc giả mới: {full_name}")
         return reader
 
+    def _scored_readers(self, reader_id: Optional[str], id_number: Optional[str], full_name: Optional[str],
+                        email: Optional[str], min_similarity: int) -> Iterator[tuple]:
+        """
+        Sinh (điểm, vị trí, độc giả) cho các độc giả khớp, theo thứ tự đăng ký.
+        Không tìm theo họ tên thì mọi độc giả khớp có điểm 100.
+        """
+        if full_name:
+            # Chỉ nạp thư viện so khớp mờ khi thật sự tìm theo họ tên
+            from fuzzywuzzy import fuzz
+
+        # Số định danh được tra trực tiếp qua chỉ mục thay vì duyệt cả danh sách,
+        # mã độc giả và email (kể cả một phần) được tra qua chỉ mục trigram
+        if id_number:
+            candidates = []
+            for key in ("id_card", "student_id", "employee_id"):
+                reader = self._find_by_key(key, id_number)
+                if reader is not None and all(reader is not found for found in candidates):
+                    candidates.append(reader)
+        else:
+            candidates = self._reader_search.search(reader_id=reader_id, email=email)
+            # Email đầy đủ vẫn tìm theo chuỗi con ("an@gmail.com" khớp cả "tran@gmail.com");
+            # chỉ mục email chỉ bổ sung bản ghi trùng khớp chính xác, không thu hẹp kết quả
+            exact = self._find_by_key("email", email) if email and self._validate_email(email) else None
+            if exact is not None and all(exact is not reader for reader in candidates):
+                candidates = sorted(candidates + [exact], key=self._reader_search.position)
+
+        if full_name:
+            query = search_key(full_name)
+            # Chỉ chấm điểm mờ các độc giả có đủ bigram chung để có thể đạt min_similarity
+            shortlist = self._name_shortlist.shortlist(query, min_similarity)
+            if shortlist is not None:
+                candidates = [reader for reader in candidates if reader['reader_id'] in shortlist]
+
+        for reader in candidates:
+            if not self._reader_search.matches(reader, reader_id=reader_id, email=email):
+                continue
+            if id_number and id_number not in (reader['id_card'], 
+                                            reader.get('student_id', ''), 
+                                            reader.get('employee_id', '')):
+                continue
+            score = 100
+            if full_name:
+                score = fuzz.partial_ratio(query, self._name_keys.get(reader['reader_id'], ''))
+                if score < min_similarity:
+                    continue
+            yield score, self._reader_search.position(reader), reader
+
+    @staticmethod
+    def _reader_summary(reader: Dict) -> Dict:
+        return {
+            "reader_id": reader['reader_id'],
+            "full_name": reader['full_name'],
+            "id_card": reader['id_card'],
+            "reader_type": reader['reader_type'],
+            "status": reader['status'],
+            "borrowed_books": reader.get('borrowed_books', 0),
+            "overdue_books": reader.get('overdue_books', 0),
+            "fine_amount": reader.get('fine_amount', 0)
+        }
+
     def search_readers(self, reader_id: Optional[str] = None, 
                      id_number: Optional[str] = None, 
                      full_name: Optional[str] = None, 
                      email: Optional[str] = None,
                      min_similarity: int = 80) -> List[Dict]:
+        # Số định danh được so khớp chính xác nên giữ nguyên; email chỉ khác hoa thường cho cùng kết quả
+        key = ("readers", search_key(reader_id) or None, id_number or None, search_key(full_name) or None,
+               email.lower() if email else None, min_similarity)
+        results = self.search_cache.get(key, self.generation)
+        if results is not None:
+            return results
         results = []
-        
-        for reader in self.readers:
-            match = True
-            if reader_id and reader_id.lower() not in reader['reader_id'].lower():
-                match = False
-            if id_number and id_number not in (reader['id_card'], 
-                                            reader.get('student_id', ''), 
-                                            reader.get('employee_id', '')):
-                match = False
-            if email and email.lower() not in reader['email'].lower():
-                match = False
-            if full_name:
-                similarity = fuzz.partial_ratio(full_name.lower(), reader['full_name'].lower())
-                if similarity < min_similarity:
-                    match = False
-            
-            if match:
-                results.append({
-                    "stt": len(results) + 1,
-                    "reader_id": reader['reader_id'],
-                    "full_name": reader['full_name'],
-                    "id_card": reader['id_card'],
-                    "reader_type": reader['reader_type'],
-                    "status": reader['status'],
-                    "borrowed_books": reader.get('borrowed_books', 0),
-                    "overdue_books": reader.get('overdue_books', 0),
-                    "fine_amount": reader.get('fine_amount', 0)
-                })
-        
+        for _, _, reader in self._scored_readers(reader_id, id_number, full_name, email, min_similarity):
+            results.append({"stt": len(results) + 1, **self._reader_summary(reader)})
+        self.search_cache.put(key, self.generation, results)
         return results
 
+    def rank_readers(self, reader_id: Optional[str] = None,
+                     id_number: Optional[str] = None,
+                     full_name: Optional[str] = None,
+                     email: Optional[str] = None,
+                     min_similarity: int = 80,
+                     limit: int = 20, cursor: Optional[str] = None) -> Dict:
+        """
+        Tìm kiếm xếp hạng: chỉ giữ limit độc giả có điểm tương đồng cao nhất (kèm điểm "score").
+        Truyền "next_cursor" của trang trước vào cursor để lấy trang kế tiếp.
+        """
+        scored = self._scored_readers(reader_id, id_number, full_name, email, min_similarity)
+        page, next_cursor = top_k(scored, limit, cursor)
+        return {
+            "results": [{**self._reader_summary(reader), "score": score} for score, _, reader in page],
+            "next_cursor": next_cursor
+        }
+
+    def match_names(self, names: List[str], min_similarity: int = 80, limit: int = 5,
+                    workers: Optional[int] = None) -> List[Dict]:
+        """
+        So khớp mờ hàng loạt nhiều họ tên (ví dụ danh sách sinh viên của một lớp) với danh sách độc giả,
+        chia danh sách cho workers tiến trình (mặc định bằng số CPU; lô nhỏ được so khớp ngay trong
+        tiến trình hiện tại). Mỗi họ tên nhận tối đa limit độc giả khớp nhất kèm điểm "score",
+        cùng thứ tự với rank_readers.
+        """
+        by_position = {self._reader_search.position(reader): reader for reader in self._readers_by_id.values()}
+        entries = [(position, self._name_keys[reader['reader_id']]) for position, reader in by_position.items()]
+        matches = self.batch_matcher.match([search_key(name) for name in names], entries, self.generation,
+                                           min_similarity, limit, workers)
+        return [{
+            "query": name,
+            "matches": [{**self._reader_summary(by_position[position]), "score": score} for score, position in found]
+        } for name, found in zip(names, matches)]
+
     def get_reader_details(self, reader_id: str) -> Optional[Dict]:
-        return next((reader for reader in self.readers if reader['reader_id'] == reader_id), None)
+        return self._readers_by_id.get(reader_id)
 
+    @transactional
     def update_reader_info(self, reader_id: str, full_name: Optional[str] = None, 
                          phone: Optional[str] = None, email: Optional[str] = None, 
                          address: Optional[str] = None) -> bool:
@@ -218,6 +479,9 @@ class ReaderManager:
         if email:
             if not self._validate_email(email):
                 raise ValueError("Định dạng email không hợp lệ")
+            owner = self._find_by_key("email", email)
+            if owner is not None and owner is not reader:
+                raise ValueError("Email đã được độc giả khác sử dụng")
             updates['email'] = email
             old_values['email'] = reader['email']
         if address:
@@ -234,13 +498,14 @@ class ReaderManager:
         }
         
         reader['update_history'].append(update_record)
-        reader.update(updates)
+        self._reindex_reader(reader, updates)
         
-        self._save_readers()
+        self._save_readers(reader)
         self._log_action("update_info", reader_id, f"Cập nhật thông tin cá nhân: {updates}")
         self.send_notification(reader_id, "update_info", f"Thông tin cá nhân của bạn đã được cập nhật: {updates}")
         return True
 
+    @transactional
     def send_notification(self, reader_id: str, notification_type: str, message: str) -> bool:
         reader = self.get_reader_details(reader_id)
         if not reader:
@@ -262,9 +527,10 @@ class ReaderManager:
             reader['notifications'] = []
         reader['notifications'].append(notification)
         
-        self._save_readers()
+        self._save_readers(reader)
         return True
 
+    @transactional
     def restore_account(self, reader_id: str, paid_fine: bool = False, paid_annual_fee: bool = False) -> bool:
         reader = self.get_reader_details(reader_id)
         if not reader:
@@ -289,12 +555,13 @@ class ReaderManager:
 
         reader['status'] = 'active'
         
-        self._save_readers()
+        self._save_readers(reader)
         self._log_action("restore", reader_id, f"Khôi phục tài khoản: {reader['full_name']}")
         self.send_notification(reader_id, "account_restored", 
                              "Tài khoản của bạn đã được khôi phục thành công!")
         return True
 
+    @transactional
     def update_reader(self, reader_id: str, updates: Dict) -> bool:
         reader = self.get_reader_details(reader_id)
         if not reader:
@@ -326,15 +593,19 @@ class ReaderManager:
             updates['max_books'] = reader_type_info['max_books']
             updates['special_document'] = reader_type_info['special_document']
 
-        for key, value in updates.items():
-            if key in reader:
-                reader[key] = value.upper() if key == 'full_name' else value
+        if self._check_duplicate(updates.get('id_card'), updates.get('student_id'), updates.get('employee_id'),
+                                 updates.get('email'), exclude=reader):
+            raise ValueError("CMND, MSSV, MSCB hoặc email đã tồn tại")
+
+        self._reindex_reader(reader, {key: value.upper() if key == 'full_name' else value
+                                      for key, value in updates.items() if key in reader})
 
-        self._save_readers()
+        self._save_readers(reader)
         self._log_action("update", reader_id, f"Cập nhật thông tin độc giả: {reader['full_name']}")
         self.send_notification(reader_id, "update", f"Thông tin độc giả của bạn đã được cập nhật")
         return True
 
+    @transactional
     def delete_reader(self, reader_id: str) -> bool:
         reader = self.get_reader_details(reader_id)
         if not reader:
@@ -344,12 +615,20 @@ class ReaderManager:
             raise ValueError("Không thể xóa độc giả đang có sách mượn")
         
         self.readers = [r for r in self.readers if r['reader_id'] != reader_id]
-        self._save_readers()
+        if self._due_loans is not None:
+            # Lịch sử cũ có thể còn lượt mượn mở dù borrowed_books bằng 0
+            for records in self._loans_of(reader).values():
+                for record in records:
+                    self._due_loans.discard(id(record))
+        self._unindex_reader(reader)
+        self._active_loans.pop(reader_id, None)
+        self._save_readers(deleted=[reader_id])
         self._log_action("delete", reader_id, f"Xóa độc giả: {reader['full_name']}")
         self.send_notification(reader_id, "account_deleted", 
                              "Tài khoản của bạn đã bị xóa khỏi hệ thống")
         return True
 
+    @transactional
     def renew_account(self, reader_id: str) -> bool:
         reader = self.get_reader_details(reader_id)
         if not reader:
@@ -358,24 +637,26 @@ class ReaderManager:
         reader['annual_fee_paid'] = True
         reader['expiry_date'] = (datetime.now() + timedelta(days=365)).isoformat()
         reader['status'] = 'active'
-        self._save_readers()
+        self._save_readers(reader)
         self._log_action("renew", reader_id, f"Gia hạn tài khoản: {reader['full_name']}")
         self.send_notification(reader_id, "account_renewed", 
                              "Tài khoản của bạn đã được gia hạn thành công!")
         return True
 
+    @transactional
     def suspend_reader(self, reader_id: str, reason: str) -> bool:
         reader = self.get_reader_details(reader_id)
         if not reader:
             return False
         
         reader['status'] = 'suspended'
-        self._save_readers()
+        self._save_readers(reader)
         self._log_action("suspend", reader_id, f"Tạm khóa độc giả: {reader['full_name']}, lý do: {reason}")
         self.send_notification(reader_id, "account_suspended", 
                              f"Tài khoản của bạn đã bị tạm khóa. Lý do: {reason}")
         return True
 
+    @transactional
     def add_borrow_record(self, reader_id: str, book_id: str, borrow_date: str, due_date: str) -> bool:
         reader = self.get_reader_details(reader_id)
         if not reader:
@@ -392,48 +673,52 @@ class ReaderManager:
             raise ValueError(f"Đã đạt số lượng sách mượn tối đa ({max_books})")
 
         reader['borrowed_books'] += 1
-        reader['borrow_history'].append({
+        record = {
             "book_id": book_id,
             "borrow_date": borrow_date,
             "due_date": due_date,
             "return_date": None,
             "status": "borrowed",
             "fine": 0
-        })
+        }
+        reader['borrow_history'].append(record)
+        self._loans_of(reader).setdefault(book_id, []).append(record)
+        self._track_loan_due(reader, record)
         
-        self._save_readers()
+        self._save_readers(reader)
         self._log_action("borrow", reader_id, f"Mượn sách {book_id}")
         self.send_notification(reader_id, "book_borrowed", 
                              f"Bạn đã mượn sách {book_id}. Ngày trả: {due_date}")
         return True
 
+    @transactional
     def return_book(self, reader_id: str, book_id: str, return_date: str, fine_per_day: int = 5000) -> Dict:
         reader = self.get_reader_details(reader_id)
         if not reader:
             return {"success": False, "fine": 0}
 
-        for record in reader['borrow_history']:
-            if record['book_id'] == book_id and record['status'] == 'borrowed':
-                record['return_date'] = return_date
-                record['status'] = 'returned'
-                reader['borrowed_books'] -= 1
-
-                due_date = datetime.fromisoformat(record['due_date'])
-                return_date_dt = datetime.fromisoformat(return_date)
-                if return_date_dt > due_date:
-                    days_late = (return_date_dt - due_date).days
-                    fine = days_late * fine_per_day
-                    record['fine'] = fine
-                    reader['fine_amount'] = reader.get('fine_amount', 0) + fine
-                    reader['overdue_books'] = reader.get('overdue_books', 0) + 1
-
-                self._save_readers()
-                self._log_action("return", reader_id, f"Trả sách {book_id}, Phí phạt: {record.get('fine', 0)} VNĐ")
-                self.send_notification(reader_id, "book_returned", 
-                                     f"Bạn đã trả sách {book_id}. Phí phạt: {record.get('fine', 0)} VNĐ")
-                return {"success": True, "fine": record.get('fine', 0)}
-        
-        raise ValueError("Không tìm thấy bản ghi mượn sách")
+        record = self.find_active_loan(reader, book_id)
+        if record is None:
+            raise ValueError("Không tìm thấy bản ghi mượn sách")
+
+        record['return_date'] = return_date
+        self.set_loan_status(reader, record, 'returned')
+        reader['borrowed_books'] -= 1
+
+        due_date = datetime.fromisoformat(record['due_date'])
+        return_date_dt = datetime.fromisoformat(return_date)
+        if return_date_dt > due_date:
+            days_late = (return_date_dt - due_date).days
+            fine = days_late * fine_per_day
+            record['fine'] = fine
+            reader['fine_amount'] = reader.get('fine_amount', 0) + fine
+            reader['overdue_books'] = reader.get('overdue_books', 0) + 1
+
+        self._save_readers(reader)
+        self._log_action("return", reader_id, f"Trả sách {book_id}, Phí phạt: {record.get('fine', 0)} VNĐ")
+        self.send_notification(reader_id, "book_returned", 
+                             f"Bạn đã trả sách {book_id}. Phí phạt: {record.get('fine', 0)} VNĐ")
+        return {"success": True, "fine": record.get('fine', 0)}
 
     def get_borrowing_stats(self) -> Dict:
         stats = {
@@ -445,10 +730,12 @@ class ReaderManager:
             "expired_readers": 0
         }
         
+        expired = []
         for reader in self.readers:
             expiry_date = datetime.fromisoformat(reader['expiry_date'])
-            if expiry_date < datetime.now():
+            if expiry_date < datetime.now() and reader['status'] != 'expired':
                 reader['status'] = 'expired'
+                expired.append(reader)
             
             if reader['status'] == 'active':
                 stats['active_readers'] += 1
@@ -463,7 +750,8 @@ class ReaderManager:
             else:
                 stats['returned_readers'] += 1
                 
-        self._save_readers()
+        if expired:
+            self._save_readers(*expired)
         return stats
 
     def get_top_borrowers(self, limit: int = 5) -> List[Dict]:
@@ -495,19 +783,22 @@ class ReaderManager:
         return ratios
 
     def get_overdue_readers(self) -> List[Dict]:
+        # Chỉ duyệt các lượt mượn quá hạn qua chỉ mục hạn trả, nhưng giữ kết quả như trước đây:
+        # theo thứ tự danh sách độc giả, mỗi độc giả kèm lượt mượn quá hạn đầu tiên trong lịch sử mượn
+        overdue = {}
+        for reader, record in self._due_loans_index().before(datetime.now()):
+            overdue.setdefault(id(reader), (reader, []))[1].append(record)
+
         overdue_readers = []
-        for reader in self.readers:
-            for record in reader['borrow_history']:
-                if record['status'] == 'borrowed':
-                    due_date = datetime.fromisoformat(record['due_date'])
-                    if due_date < datetime.now():
-                        overdue_readers.append({
-                            "reader_id": reader['reader_id'],
-                            "full_name": reader['full_name'],
-                            "book_id": record['book_id'],
-                            "due_date": record['due_date']
-                        })
-                        break
+        for reader, records in sorted(overdue.values(), key=lambda item: self._reader_search.position(item[0])):
+            order = {id(history): i for i, history in enumerate(reader['borrow_history'])}
+            record = min(records, key=lambda r: order.get(id(r), len(order)))
+            overdue_readers.append({
+                "reader_id": reader['reader_id'],
+                "full_name": reader['full_name'],
+                "book_id": record['book_id'],
+                "due_date": record['due_date']
+            })
         return overdue_readers
 
     def get_readers_with_fines(self) -> List[Dict]:
@@ -0,0 +1,393 @@
+import heapq
+import os
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Hashable, Iterable, List, Optional, Set
+
+
+def search_key(text: Optional[str]) -> str:
+    """
+    Khóa tìm kiếm: chuẩn hóa Unicode, bỏ dấu tiếng Việt (kể cả đ -> d) và chuyển chữ thường,
+    để "nguyen van a" khớp với "NGUYỄN VĂN A"
+    """
+    text = unicodedata.normalize('NFKD', str(text or '')).replace('đ', 'd').replace('Đ', 'D')
+    return ''.join(ch for ch in text if not unicodedata.combining(ch)).lower()
+
+
+def ngrams(text: str, n: int = 3) -> Set[str]:
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class SubstringIndex:
+    """
+    Chỉ mục n-gram (mặc định trigram) trên các trường mã / email của một tập bản ghi để tìm
+    theo chuỗi con ("BR0012") mà chỉ phải kiểm tra các bản ghi ứng viên. Khóa tìm kiếm
+    (search_key) của mỗi trường được tính sẵn một lần khi thêm bản ghi.
+    """
+    def __init__(self, key: str, fields: Iterable[str], n: int = 3):
+        self.key = key
+        self.fields = tuple(fields)
+        self.n = n
+        self._records: Dict[str, Dict] = {}
+        self._order: Dict[str, int] = {}
+        self._counter = 0
+        self._values = {field: {} for field in self.fields}
+        self._postings = {field: {} for field in self.fields}
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def _value(self, record: Dict, field: str) -> str:
+        return search_key(record.get(field))
+
+    def _add_field(self, key: str, field: str, value: str):
+        self._values[field][key] = value
+        postings = self._postings[field]
+        for gram in ngrams(value, self.n):
+            postings.setdefault(gram, set()).add(key)
+
+    def _remove_field(self, key: str, field: str):
+        value = self._values[field].pop(key, None)
+        if value is None:
+            return
+        postings = self._postings[field]
+        for gram in ngrams(value, self.n):
+            keys = postings.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del postings[gram]
+
+    def add(self, record: Dict):
+        """
+        Thêm bản ghi; nếu bản ghi đã có thì tính lại các trường mà vẫn giữ thứ tự cũ.
+        Bản ghi khác trùng khóa bị bỏ qua (giữ bản ghi đầu tiên như các chỉ mục theo mã).
+        """
+        key = record[self.key]
+        existing = self._records.get(key)
+        if existing is not None and existing is not record:
+            return
+        if existing is None:
+            self._records[key] = record
+            self._order[key] = self._counter
+            self._counter += 1
+        for field in self.fields:
+            value = self._value(record, field)
+            if self._values[field].get(key) != value:
+                self._remove_field(key, field)
+                self._add_field(key, field, value)
+
+    def discard(self, record: Dict):
+        key = record[self.key]
+        if self._records.get(key) is not record:
+            return
+        for field in self.fields:
+            self._remove_field(key, field)
+        del self._records[key]
+        del self._order[key]
+
+    def _match(self, field: str, query: str) -> Set[str]:
+        values = self._values[field]
+        if len(query) < self.n:
+            # Chuỗi quá ngắn để tra n-gram: duyệt các khóa đã tính sẵn
+            return {key for key, value in values.items() if query in value}
+        postings = sorted((self._postings[field].get(gram, set()) for gram in ngrams(query, self.n)), key=len)
+        candidates = set(postings[0])
+        for keys in postings[1:]:
+            candidates &= keys
+            if not candidates:
+                break
+        return {key for key in candidates if query in values[key]}
+
+    def position(self, record: Dict) -> int:
+        """
+        Thứ tự thêm vào của bản ghi (ổn định, dùng để sắp xếp và phân trang)
+        """
+        return self._order.get(record[self.key], self._counter)
+
+    def matches(self, record: Dict, **criteria: Optional[str]) -> bool:
+        """
+        Bản ghi (đã có trong chỉ mục) có chứa mọi chuỗi con đã cho hay không
+        """
+        key = record[self.key]
+        return all(search_key(query) in self._values[field].get(key, '')
+                   for field, query in criteria.items() if query)
+
+    def search(self, **criteria: Optional[str]) -> List[Dict]:
+        """
+        Các bản ghi chứa mọi chuỗi con đã cho (không phân biệt hoa thường và dấu) theo thứ tự
+        thêm vào; tiêu chí rỗng được bỏ qua, không có tiêu chí nào thì trả về mọi bản ghi
+        """
+        candidates = None
+        for field, query in criteria.items():
+            if not query:
+                continue
+            keys = self._match(field, search_key(query))
+            candidates = keys if candidates is None else candidates & keys
+        if candidates is None:
+            return list(self._records.values())
+        return [self._records[key] for key in sorted(candidates, key=self._order.__getitem__)]
+
+
+class FuzzyShortlist:
+    """
+    Chỉ mục bigram (có đếm số lần xuất hiện) dùng để lọc trước ứng viên cho fuzz.partial_ratio.
+
+    Với s là chuỗi ngắn hơn (độ dài a) và cửa sổ w (độ dài b <= a) của chuỗi dài hơn mà
+    partial_ratio chấm điểm, r = 2M / (a + b) với M ký tự khớp. Mỗi ký tự không khớp của s
+    làm hỏng tối đa 2 bigram của s, mỗi khoảng chèn của w làm hỏng tối đa 1, nên số bigram của s
+    còn nguyên trong w (và do đó dùng chung với chuỗi dài) ít nhất là 3M - a - b - 1. Thay
+    M = r(a + b) / 2 và b >= r·a / (2 - r) được chặn dưới c(r)·a - 1 với
+    c(r) = (1.5r - 1)·2 / (2 - r). Chuỗi nào dùng chung ít bigram hơn chặn này thì chắc chắn
+    có điểm dưới ngưỡng, nên kết quả sau khi lọc trùng khớp hoàn toàn với việc chấm điểm mọi bản ghi.
+    """
+    def __init__(self):
+        self._texts: Dict[str, str] = {}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._by_length: Dict[int, Set[str]] = {}
+
+    @staticmethod
+    def _bigram_counts(text: str) -> Dict[str, int]:
+        counts = {}
+        for i in range(len(text) - 1):
+            gram = text[i:i + 2]
+            counts[gram] = counts.get(gram, 0) + 1
+        return counts
+
+    def add(self, key: str, text: str):
+        if self._texts.get(key) == text:
+            return
+        self.discard(key)
+        self._texts[key] = text
+        self._by_length.setdefault(len(text), set()).add(key)
+        for gram, count in self._bigram_counts(text).items():
+            self._postings.setdefault(gram, {})[key] = count
+
+    def discard(self, key: str):
+        text = self._texts.pop(key, None)
+        if text is None:
+            return
+        keys = self._by_length[len(text)]
+        keys.discard(key)
+        if not keys:
+            del self._by_length[len(text)]
+        for gram in self._bigram_counts(text):
+            postings = self._postings[gram]
+            del postings[key]
+            if not postings:
+                del self._postings[gram]
+
+    @staticmethod
+    def _coefficient(min_similarity: int) -> float:
+        # partial_ratio làm tròn 100·r, nên điểm >= ngưỡng khi r >= (ngưỡng - 0.5) / 100
+        r = (min_similarity - 0.5) / 100
+        return (1.5 * r - 1) * 2 / (2 - r)
+
+    def shortlist(self, query: str, min_similarity: int) -> Optional[Set[str]]:
+        """
+        Các khóa có thể đạt min_similarity với query; None nghĩa là không lọc được
+        (ngưỡng quá thấp hoặc truy vấn quá ngắn) và phải chấm điểm toàn bộ
+        """
+        c = self._coefficient(min_similarity)
+        # Chuỗi ngắn hơn có độ dài <= limit không bị ràng buộc số bigram dùng chung
+        limit = 1 / c if c > 0 else float('inf')
+        if len(query) <= limit:
+            return None
+
+        shared: Dict[str, int] = {}
+        for gram, count in self._bigram_counts(query).items():
+            for key, key_count in self._postings.get(gram, {}).items():
+                shared[key] = shared.get(key, 0) + min(count, key_count)
+
+        candidates = set()
+        for length, keys in self._by_length.items():
+            if length <= limit:
+                candidates |= keys
+        for key, count in shared.items():
+            if count >= c * min(len(query), len(self._texts[key])) - 1 - 1e-9:
+                candidates.add(key)
+        return candidates
+
+
+class SearchCache:
+    """
+    Bộ nhớ đệm LRU cho kết quả tìm kiếm, khóa theo các tham số tìm kiếm đã chuẩn hóa. Mỗi lần tra
+    kèm số thế hệ (generation) hiện tại của manager; khi thế hệ đổi (đã có thay đổi dữ liệu)
+    toàn bộ kết quả cũ bị bỏ nên không bao giờ trả về kết quả lỗi thời.
+    """
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self.generation = None
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, generation: int) -> Optional[List[Dict]]:
+        if generation != self.generation:
+            self._entries.clear()
+            self.generation = generation
+        results = self._entries.get(key)
+        if results is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        # Trả về bản sao để người gọi sửa kết quả không làm hỏng bộ nhớ đệm
+        return [dict(result) for result in results]
+
+    def put(self, key: Hashable, generation: int, results: List[Dict]):
+        if self.maxsize <= 0 or generation != self.generation:
+            return
+        self._entries[key] = [dict(result) for result in results]
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries), "maxsize": self.maxsize}
+
+
+def encode_cursor(score: int, position: int) -> str:
+    return f"{score}:{position}"
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        score, position = cursor.split(":")
+        return -int(score), int(position)
+    except (AttributeError, ValueError):
+        raise ValueError("Con trỏ phân trang không hợp lệ")
+
+
+def top_k(scored: Iterable[tuple], k: int, cursor: Optional[str] = None) -> tuple:
+    """
+    Chọn k phần tử (điểm, vị trí, bản ghi) tốt nhất bằng heap giới hạn: điểm cao trước, cùng điểm
+    thì vị trí nhỏ trước. cursor là con trỏ của trang trước; trả về (trang, con trỏ trang kế tiếp
+    hoặc None nếu đã hết). Con trỏ chỉ ghi (điểm, vị trí) của phần tử cuối nên không cần giữ trạng thái.
+    """
+    if k <= 0:
+        raise ValueError("Số kết quả mỗi trang phải lớn hơn 0")
+    if cursor:
+        after = decode_cursor(cursor)
+        scored = (entry for entry in scored if (-entry[0], entry[1]) > after)
+    page = heapq.nsmallest(k + 1, scored, key=lambda entry: (-entry[0], entry[1]))
+    next_cursor = encode_cursor(page[k - 1][0], page[k - 1][1]) if len(page) > k else None
+    return page[:k], next_cursor
+
+
+def _chunk_state(entries: List[tuple], start: int, stop: int, cache: Dict[tuple, tuple]) -> tuple:
+    """
+    Khóa tìm kiếm và chỉ mục bigram của một phần kho entries[start:stop], tính một lần rồi giữ lại
+    """
+    state = cache.get((start, stop))
+    if state is None:
+        texts = dict(entries[start:stop])
+        shortlist = FuzzyShortlist()
+        for position, text in texts.items():
+            shortlist.add(position, text)
+        state = cache[(start, stop)] = (texts, shortlist)
+    return state
+
+
+def _score_chunk(texts: Dict[int, str], shortlist: FuzzyShortlist, queries: List[str],
+                 min_similarity: int, limit: int) -> List[List[tuple]]:
+    """
+    Cho từng truy vấn, tối đa limit cặp (điểm, vị trí) tốt nhất của một phần kho
+    """
+    from fuzzywuzzy import fuzz
+    results = []
+    for query in queries:
+        candidates = shortlist.shortlist(query, min_similarity)
+        scored = []
+        for position in (texts if candidates is None else candidates):
+            score = fuzz.partial_ratio(query, texts[position])
+            if score >= min_similarity:
+                scored.append((score, position))
+        results.append(heapq.nsmallest(limit, scored, key=lambda entry: (-entry[0], entry[1])))
+    return results
+
+
+# Trạng thái của tiến trình con: kho được gửi một lần qua initializer, chỉ mục từng phần được giữ lại
+_worker_entries: List[tuple] = []
+_worker_chunks: Dict[tuple, tuple] = {}
+
+
+def _init_worker(entries: List[tuple]):
+    global _worker_entries
+    _worker_entries = entries
+    _worker_chunks.clear()
+
+
+def _match_worker_chunk(task: tuple) -> List[List[tuple]]:
+    start, stop, queries, min_similarity, limit = task
+    texts, shortlist = _chunk_state(_worker_entries, start, stop, _worker_chunks)
+    return _score_chunk(texts, shortlist, queries, min_similarity, limit)
+
+
+def _merge(results: List[List[tuple]], limit: int) -> List[tuple]:
+    return heapq.nsmallest(limit, (entry for chunk in results for entry in chunk),
+                           key=lambda entry: (-entry[0], entry[1]))
+
+
+class BatchMatcher:
+    """
+    So khớp mờ hàng loạt trên một kho (các cặp (vị trí, khóa tìm kiếm)) bằng nhiều tiến trình.
+
+    Pool tiến trình được giữ lại giữa các lần gọi: kho chỉ được gửi cho mỗi tiến trình một lần (qua
+    initializer) cho mỗi phiên bản dữ liệu (version, ví dụ generation của manager), và chỉ mục bigram
+    của từng phần được giữ lại trong tiến trình con. Các lần gọi sau chỉ gửi truy vấn.
+    Khi khối lượng việc (số truy vấn x kích thước kho) nhỏ hơn min_parallel_work, so khớp ngay trong
+    tiến trình hiện tại vì chi phí khởi tạo pool và gửi kho lớn hơn phần tiết kiệm được.
+    """
+    def __init__(self, workers: Optional[int] = None, min_parallel_work: int = 200_000):
+        self.workers = workers
+        self.min_parallel_work = min_parallel_work
+        self._pool = None
+        self._pool_key = None
+        self._local_key = None
+        self._local_chunks: Dict[tuple, tuple] = {}
+
+    def _workers(self, workers: Optional[int], size: int) -> int:
+        workers = workers or self.workers or os.cpu_count() or 1
+        return max(1, min(workers, size))
+
+    def match(self, queries: List[str], entries: List[tuple], version: Hashable,
+              min_similarity: int = 80, limit: int = 5, workers: Optional[int] = None) -> List[List[tuple]]:
+        """
+        Tối đa limit cặp (điểm, vị trí) tốt nhất cho mỗi truy vấn (đã là khóa tìm kiếm), cùng thứ tự với top_k.
+        entries chỉ được đọc lại khi version thay đổi.
+        """
+        if limit <= 0:
+            raise ValueError("Số kết quả mỗi truy vấn phải lớn hơn 0")
+        if not queries or not entries:
+            return [[] for _ in queries]
+        workers = self._workers(workers, len(entries))
+        if workers == 1 or len(queries) * len(entries) < self.min_parallel_work:
+            if self._local_key != version:
+                self._local_key = version
+                self._local_chunks = {}
+            texts, shortlist = _chunk_state(entries, 0, len(entries), self._local_chunks)
+            return _score_chunk(texts, shortlist, queries, min_similarity, limit)
+
+        if self._pool_key != (version, workers):
+            self.close()
+            self._pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(entries,))
+            self._pool_key = (version, workers)
+        size = -(-len(entries) // workers)
+        tasks = [(start, min(start + size, len(entries)), queries, min_similarity, limit)
+                 for start in range(0, len(entries), size)]
+        chunks = list(self._pool.map(_match_worker_chunk, tasks))
+        return [_merge([chunk[i] for chunk in chunks], limit) for i in range(len(queries))]
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+            self._pool_key = None
@@ -0,0 +1,117 @@
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterable, List, Optional
+
+
+class IdSequence:
+    """
+    Dãy mã tăng dần được lưu trên đĩa (<tên>.seq cạnh file dữ liệu), không bao giờ cấp lại
+    mã đã dùng kể cả khi bản ghi bị xóa. Mỗi lần cấp mã đều khóa file <tên>.seq.lock nên
+    nhiều tiến trình (nhiều quầy) có thể dùng chung một dãy. reserve(n) cấp cả một khối mã
+    trong một lần khóa cho các thao tác nhập hàng loạt.
+    """
+    def __init__(self, path: str, prefix: str, width: int,
+                 seed: Optional[Callable[[], Iterable[str]]] = None,
+                 block_size: int = 1, lock_timeout: float = 10.0, stale_after: float = 30.0):
+        self.path = os.path.splitext(path)[0] + ".seq"
+        self.lock_path = self.path + ".lock"
+        self.prefix = prefix
+        self.width = width
+        # Hàm trả về các mã đang có, dùng để khởi tạo dãy khi chưa có file .seq
+        self.seed = seed
+        # Số mã lấy trước mỗi lần khóa; >1 giảm tranh chấp nhưng có thể để lại khoảng trống
+        self.block_size = max(1, block_size)
+        self.lock_timeout = lock_timeout
+        self.stale_after = stale_after
+        self._pattern = re.compile(re.escape(prefix) + r"(\d+)$")
+        self._thread_lock = threading.Lock()
+        self._block: List[int] = []
+
+    def format(self, number: int) -> str:
+        return f"{self.prefix}{str(number).zfill(self.width)}"
+
+    def number_of(self, value: str) -> Optional[int]:
+        match = self._pattern.match(value or "")
+        return int(match.group(1)) if match else None
+
+    @contextmanager
+    def _locked(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        deadline = time.monotonic() + self.lock_timeout
+        while True:
+            try:
+                fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                try:
+                    # Khóa bị bỏ lại bởi một tiến trình đã dừng đột ngột
+                    if time.time() - os.path.getmtime(self.lock_path) > self.stale_after:
+                        os.remove(self.lock_path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Không thể khóa dãy mã {self.path}")
+                time.sleep(0.01)
+        try:
+            os.write(fd, str(os.getpid()).encode())
+            yield
+        finally:
+            os.close(fd)
+            os.remove(self.lock_path)
+
+    def _read_last(self) -> int:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)["last"]
+        except (FileNotFoundError, ValueError, KeyError):
+            # Chưa có dãy (hoặc file hỏng): bắt đầu sau mã lớn nhất đang có
+            numbers = [self.number_of(value) for value in (self.seed() if self.seed else [])]
+            return max((n for n in numbers if n is not None), default=0)
+
+    def _write_last(self, last: int):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"last": last}, f)
+        os.replace(tmp_path, self.path)
+
+    def _allocate(self, count: int, floor: int = 0) -> List[int]:
+        with self._locked():
+            last = max(self._read_last(), floor)
+            self._write_last(last + count)
+        return list(range(last + 1, last + count + 1))
+
+    def next(self) -> str:
+        """
+        Cấp mã kế tiếp
+        """
+        with self._thread_lock:
+            if not self._block:
+                self._block = self._allocate(self.block_size)
+            return self.format(self._block.pop(0))
+
+    def reserve(self, count: int) -> List[str]:
+        """
+        Cấp một khối count mã liên tiếp trong một lần khóa
+        """
+        if count <= 0:
+            return []
+        with self._thread_lock:
+            return [self.format(number) for number in self._allocate(count)]
+
+    def advance_past(self, values: Iterable[str]):
+        """
+        Đảm bảo dãy không cấp lại các mã đã được đưa vào từ bên ngoài (ví dụ khi nhập file)
+        """
+        numbers = [n for n in (self.number_of(value) for value in values) if n is not None]
+        if not numbers:
+            return
+        with self._thread_lock:
+            self._block = [n for n in self._block if n > max(numbers)]
+            self._allocate(0, max(numbers))
@@ -0,0 +1,113 @@
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # orjson là phụ thuộc tùy chọn
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # msgpack là phụ thuộc tùy chọn
+    msgpack = None
+
+
+class JsonCodec:
+    """
+    JSON chuẩn của Python; indent=4 giữ đúng định dạng file hiện có, indent=None cho JSON gọn
+    """
+    binary = False
+
+    def __init__(self, indent: int = 4):
+        self.indent = indent
+        self.name = "json" if indent else "json-compact"
+
+    def dumps(self, obj: Any) -> bytes:
+        if self.indent:
+            text = json.dumps(obj, ensure_ascii=False, indent=self.indent)
+        else:
+            text = json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+        return text.encode('utf-8')
+
+    def loads(self, data: bytes) -> Any:
+        return json.loads(data)
+
+
+class OrjsonCodec:
+    """
+    JSON gọn được mã hóa/giải mã bằng orjson (nhanh hơn nhiều lần so với json chuẩn)
+    """
+    name = "orjson"
+    binary = False
+
+    def dumps(self, obj: Any) -> bytes:
+        return orjson.dumps(obj)
+
+    def loads(self, data: bytes) -> Any:
+        return orjson.loads(data)
+
+
+class MsgpackCodec:
+    """
+    Định dạng nhị phân MessagePack: file nhỏ hơn, nhưng không còn đọc được bằng trình soạn thảo
+    """
+    name = "msgpack"
+    binary = True
+
+    def dumps(self, obj: Any) -> bytes:
+        return msgpack.packb(obj, use_bin_type=True)
+
+    def loads(self, data: bytes) -> Any:
+        return msgpack.unpackb(data, raw=False)
+
+
+def available_codecs() -> list:
+    names = ["json", "json-compact"]
+    if orjson is not None:
+        names.append("orjson")
+    if msgpack is not None:
+        names.append("msgpack")
+    return names
+
+
+def get_codec(name: str = "json"):
+    """
+    Lấy bộ mã hóa theo tên: json, json-compact, orjson, msgpack
+    """
+    if name == "json":
+        return JsonCodec()
+    if name == "json-compact":
+        return JsonCodec(indent=None)
+    if name == "orjson":
+        if orjson is None:
+            raise ValueError("Chưa cài đặt orjson (pip install orjson)")
+        return OrjsonCodec()
+    if name == "msgpack":
+        if msgpack is None:
+            raise ValueError("Chưa cài đặt msgpack (pip install msgpack)")
+        return MsgpackCodec()
+    raise ValueError(f"Định dạng '{name}' không được hỗ trợ")
+
+
+def convert_file(src_path: str, dst_path: str, src_codec: str, dst_codec: str) -> int:
+    """
+    Chuyển một file dữ liệu từ định dạng này sang định dạng khác, trả về số bản ghi
+    """
+    with open(src_path, 'rb') as f:
+        records = get_codec(src_codec).loads(f.read())
+    with open(dst_path, 'wb') as f:
+        f.write(get_codec(dst_codec).dumps(records))
+    return len(records)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Chuyển đổi định dạng file dữ liệu thư viện")
+    parser.add_argument("src")
+    parser.add_argument("dst")
+    parser.add_argument("--from", dest="src_codec", default="json", choices=["json", "json-compact", "orjson", "msgpack"])
+    parser.add_argument("--to", dest="dst_codec", default="json-compact", choices=["json", "json-compact", "orjson", "msgpack"])
+    args = parser.parse_args()
+    count = convert_file(args.src, args.dst, args.src_codec, args.dst_codec)
+    print(f"Đã chuyển {count} bản ghi từ {args.src} ({args.src_codec}) sang {args.dst} ({args.dst_codec})")
@@ -0,0 +1,67 @@
+import hashlib
+import os
+import pickle
+from typing import Any, Iterable, List, Optional
+
+# Định dạng file: MAGIC | phiên bản (2 byte) | checksum blake2b (16 byte) | pickle của (dấu file nguồn, dữ liệu)
+MAGIC = b"LIBSNAP"
+VERSION = 2
+_DIGEST_SIZE = 16
+_HEADER_SIZE = len(MAGIC) + 2 + _DIGEST_SIZE
+
+
+def _checksum(payload: bytes) -> bytes:
+    return hashlib.blake2b(payload, digest_size=_DIGEST_SIZE).digest()
+
+
+def source_stamps(sources: Iterable[str]) -> List[Optional[tuple]]:
+    """
+    Dấu (mtime_ns, kích thước) của từng file nguồn, None nếu file không tồn tại
+    """
+    stamps = []
+    for source in sources:
+        try:
+            stat = os.stat(source)
+        except FileNotFoundError:
+            stamps.append(None)
+        else:
+            stamps.append((stat.st_mtime_ns, stat.st_size))
+    return stamps
+
+
+def write_snapshot(path: str, data: Any, stamps: List[Optional[tuple]]):
+    """
+    Ghi bản chụp nhị phân (ghi file tạm rồi đổi tên) kèm dấu của các file nguồn mà dữ liệu được lấy từ đó
+    """
+    payload = pickle.dumps((stamps, data), protocol=pickle.HIGHEST_PROTOCOL)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC + VERSION.to_bytes(2, 'big') + _checksum(payload))
+        f.write(payload)
+    os.replace(tmp_path, path)
+
+
+def read_snapshot(path: str, sources: Iterable[str]) -> Optional[Any]:
+    """
+    Đọc bản chụp nếu mọi file nguồn vẫn đúng như lúc chụp (cùng mtime_ns và kích thước) và bản chụp
+    còn nguyên vẹn, ngược lại trả về None. So khớp chính xác thay vì so thời gian để một lần sửa file
+    nguồn trong cùng nhịp đồng hồ với lần ghi bản chụp (hệ thống file có độ phân giải thời gian thấp)
+    không bị bỏ qua.
+    """
+    stamps = source_stamps(sources)
+    if all(stamp is None for stamp in stamps):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            content = f.read()
+    except FileNotFoundError:
+        return None
+    header, payload = content[:_HEADER_SIZE], content[_HEADER_SIZE:]
+    if not header.startswith(MAGIC) or int.from_bytes(header[len(MAGIC):len(MAGIC) + 2], 'big') != VERSION:
+        return None
+    if header[len(MAGIC) + 2:] != _checksum(payload):
+        return None
+    recorded, data = pickle.loads(payload)
+    if recorded != stamps:
+        return None
+    return data
@@ -0,0 +1,722 @@
+import atexit
+import copy
+import functools
+import json
+import os
+import re
+import sqlite3
+import struct
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import List, Dict, Optional, Iterable
+from serialization import get_codec
+from snapshot import read_snapshot, source_stamps, write_snapshot
+
+
+# Khóa chung giữa các thao tác của manager và luồng ghi nền
+_write_lock = threading.RLock()
+
+
+class PendingWrites:
+    """
+    Các thay đổi chưa được ghi xuống đĩa của một tập bản ghi
+    """
+    def __init__(self):
+        self.changed = {}
+        self.deleted = set()
+        self.full = False
+        self.count = 0
+
+    def __bool__(self) -> bool:
+        return bool(self.changed or self.deleted or self.full)
+
+    def add(self, key: Optional[str], changed: Optional[Iterable[Dict]], deleted: Iterable[str]):
+        self.count += 1
+        if changed is None and not deleted or key is None:
+            self.full = True
+            return
+        for record in changed or ():
+            self.changed[record[key]] = record
+            self.deleted.discard(record[key])
+        for record_key in deleted:
+            self.changed.pop(record_key, None)
+            self.deleted.add(record_key)
+
+    def merge(self, other: "PendingWrites"):
+        self.full = self.full or other.full
+        self.count += other.count
+        for record_key, record in other.changed.items():
+            self.changed[record_key] = record
+            self.deleted.discard(record_key)
+        for record_key in other.deleted:
+            self.changed.pop(record_key, None)
+            self.deleted.add(record_key)
+
+
+class JsonStore:
+    """
+    Lưu một danh sách bản ghi vào một file duy nhất (ghi lại toàn bộ file mỗi lần lưu).
+    Định dạng file do codec quyết định, mặc định là JSON thụt lề 4 như trước đây.
+    """
+    def __init__(self, path: str, key: Optional[str] = None, codec=None):
+        self.path = path
+        self.key = key
+        self.codec = codec or get_codec("json")
+        # Hàm chuyển bản ghi trong bộ nhớ thành dạng được ghi ra (None: ghi nguyên bản ghi)
+        self.project = None
+        # Bản chụp nhị phân <path>.snap dùng để khởi động nhanh (None: không dùng)
+        self.snapshot_path = None
+        self._depth = 0
+        self._pending = PendingWrites()
+        # Chế độ ghi nền: thay đổi được gom lại và do WriteBehindFlusher ghi xuống đĩa
+        self.flusher = None
+        self._behind = PendingWrites()
+
+    @property
+    def in_transaction(self) -> bool:
+        return self._depth > 0
+
+    @property
+    def has_pending(self) -> bool:
+        return bool(self._pending)
+
+    def load(self) -> List[Dict]:
+        if self.snapshot_path:
+            records = read_snapshot(self.snapshot_path, self._source_paths())
+            if records is not None:
+                self._after_load(records)
+                return records
+        # Lấy dấu file nguồn trước khi đọc: nếu file đổi trong lúc đọc, bản chụp sẽ không khớp lần sau
+        stamps = source_stamps(self._source_paths()) if self.snapshot_path else None
+        records = self._load_source()
+        if self.snapshot_path:
+            write_snapshot(self.snapshot_path, [self._encode(r) for r in records], stamps)
+        return records
+
+    def _load_source(self) -> List[Dict]:
+        with open(self.path, 'rb') as f:
+            return self.codec.loads(f.read())
+
+    def _source_paths(self) -> List[str]:
+        return [self.path]
+
+    def _after_load(self, records: List[Dict]):
+        pass
+
+    def save(self, records: List[Dict], changed: Optional[Iterable[Dict]] = None,
+             deleted: Iterable[str] = ()):
+        if self.in_transaction:
+            self._pending.add(self.key, changed, deleted)
+        elif self.flusher is not None:
+            self._defer_behind(records, self._single(changed, deleted))
+        else:
+            self._write(records, changed, deleted)
+
+    def _single(self, changed: Optional[Iterable[Dict]], deleted: Iterable[str]) -> PendingWrites:
+        pending = PendingWrites()
+        pending.add(self.key, changed, deleted)
+        return pending
+
+    def _defer_behind(self, records: List[Dict], pending: PendingWrites):
+        if pending.full:
+            # Ghi toàn bộ danh sách thì ghi ngay, không giữ bản sao cả danh sách trong bộ nhớ
+            with _write_lock:
+                self._behind.merge(pending)
+                self.flush(records)
+            return
+        # Giữ bản sao giá trị tại thời điểm commit: nếu một thao tác sau đó thất bại và bản ghi
+        # trong bộ nhớ bị sửa dở, các thay đổi đã hoàn tất vẫn được ghi đúng
+        pending.changed = {record_key: self._copy(record) for record_key, record in pending.changed.items()}
+        with _write_lock:
+            self._behind.merge(pending)
+            count = self._behind.count
+        self.flusher.notify(count)
+
+    @staticmethod
+    def _copy(record: Dict) -> Dict:
+        # dict.items không kích hoạt việc nạp chi tiết của LazyRecord
+        return {field: copy.deepcopy(value) for field, value in dict.items(record)}
+
+    def _write_pending(self, records: List[Dict], pending: PendingWrites):
+        if pending.full:
+            self._write(records, None, ())
+        else:
+            self._write(records, list(pending.changed.values()), list(pending.deleted))
+
+    def flush(self, records: List[Dict]):
+        """
+        Ghi xuống đĩa các thay đổi đang chờ của chế độ ghi nền
+        """
+        with _write_lock:
+            pending, self._behind = self._behind, PendingWrites()
+            if pending:
+                self._write_pending(records, pending)
+
+    def flush_committed(self):
+        """
+        Ghi các thay đổi đang chờ của chế độ ghi nền chỉ từ bản sao lúc commit, áp lên dữ liệu trên đĩa,
+        không dùng bản ghi trong bộ nhớ (có thể đang bị một thao tác thất bại sửa dở)
+        """
+        with _write_lock:
+            pending, self._behind = self._behind, PendingWrites()
+            if not pending:
+                return
+            try:
+                records = self.load()
+            except FileNotFoundError:
+                records = []
+            positions = {record[self.key]: i for i, record in enumerate(records)}
+            for record_key, record in pending.changed.items():
+                if record_key in positions:
+                    records[positions[record_key]] = record
+                else:
+                    positions[record_key] = len(records)
+                    records.append(record)
+            records = [record for record in records if record[self.key] not in pending.deleted]
+            self._write_pending(records, pending)
+
+    def _write(self, records: List[Dict], changed: Optional[Iterable[Dict]], deleted: Iterable[str]):
+        self._write_snapshot(records)
+
+    def begin(self):
+        self._depth += 1
+
+    def commit(self, records: List[Dict]):
+        self._depth -= 1
+        if self._depth or not self._pending:
+            return
+        pending, self._pending = self._pending, PendingWrites()
+        if self.flusher is not None:
+            self._defer_behind(records, pending)
+        else:
+            self._write_pending(records, pending)
+
+    def rollback(self) -> PendingWrites:
+        self._depth -= 1
+        if self._depth:
+            return PendingWrites()
+        pending, self._pending = self._pending, PendingWrites()
+        return pending
+
+    def compact(self, records: List[Dict]):
+        self._write_snapshot(records)
+
+    def close(self, records: Optional[List[Dict]] = None):
+        if records is not None and self.snapshot_path:
+            write_snapshot(self.snapshot_path, [self._encode(r) for r in records],
+                           source_stamps(self._source_paths()))
+
+    def _encode(self, record: Dict) -> Dict:
+        return record if self.project is None else self.project(record)
+
+    def _write_snapshot(self, records: List[Dict]):
+        # Ghi ra file tạm rồi đổi tên để file cũ không bao giờ bị ghi dở
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(self.codec.dumps(records if self.project is None else [self.project(r) for r in records]))
+        os.replace(tmp_path, self.path)
+
+
+class JournalStore(JsonStore):
+    """
+    Lưu theo kiểu nhật ký ghi trước: mỗi thay đổi được nối thêm thành một dòng nhỏ vào
+    file <path>.journal, file JSON đầy đủ chỉ được ghi lại khi nén (compact).
+    Khi khởi động, nhật ký được áp dụng lại lên bản chụp JSON gần nhất.
+
+    Việc nén chạy ngay trong lần ghi làm nhật ký đạt ngưỡng, nên lần ghi đó phải ghi lại cả file.
+    Ngưỡng là max(compact_every, số bản ghi): một lần nén ghi n bản ghi chỉ xảy ra sau ít nhất n dòng
+    nhật ký, nên chi phí nén chia đều cho mỗi lần ghi không vượt quá cỡ một bản ghi.
+
+    Mỗi mục nhật ký được mã hóa bằng codec của kho: codec văn bản ghi một mục trên một dòng
+    (JSON thụt lề được ghi gọn), codec nhị phân ghi mỗi mục kèm 4 byte độ dài phía trước.
+    """
+    def __init__(self, path: str, key: str, codec=None, compact_every: int = 10000, fsync: bool = False):
+        super().__init__(path, key, codec)
+        self.entry_codec = get_codec("json-compact") if self.codec.name == "json" else self.codec
+        self.journal_path = path + ".journal"
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self._journal = None
+        self._entries = 0
+
+    def _load_source(self) -> List[Dict]:
+        try:
+            records = super()._load_source()
+        except FileNotFoundError:
+            if not os.path.exists(self.journal_path):
+                raise
+            records = []
+        return self._replay(records)
+
+    def _source_paths(self) -> List[str]:
+        return [self.path, self.journal_path]
+
+    def _after_load(self, records: List[Dict]):
+        # Nạp từ bản chụp nhị phân: nhật ký không được đọc lại nhưng vẫn phải được tính vào ngưỡng nén
+        try:
+            with open(self.journal_path, 'rb') as f:
+                if self.codec.binary:
+                    self._entries = self._count_frames(f)
+                else:
+                    self._entries = sum(chunk.count(b"\n") for chunk in iter(lambda: f.read(1 << 20), b""))
+        except FileNotFoundError:
+            self._entries = 0
+
+    @staticmethod
+    def _count_frames(f) -> int:
+        # Chỉ đọc phần độ dài của mỗi mục rồi nhảy qua nội dung
+        count = 0
+        size = os.fstat(f.fileno()).st_size
+        while True:
+            header = f.read(4)
+            if len(header) < 4:
+                return count
+            end = f.tell() + struct.unpack(">I", header)[0]
+            if end > size:
+                return count
+            f.seek(end)
+            count += 1
+
+    def _encode_entry(self, entry: Dict) -> bytes:
+        data = self.entry_codec.dumps(entry)
+        if self.codec.binary:
+            return struct.pack(">I", len(data)) + data
+        return data + b"\n"
+
+    def _read_entries(self, f) -> Iterable[Dict]:
+        if not self.codec.binary:
+            for line in f:
+                try:
+                    yield self.entry_codec.loads(line)
+                except ValueError:
+                    # Dòng cuối bị ghi dở do tắt đột ngột, bỏ qua
+                    return
+            return
+        while True:
+            header = f.read(4)
+            if len(header) < 4:
+                return
+            length = struct.unpack(">I", header)[0]
+            data = f.read(length)
+            if len(data) < length:
+                # Mục cuối bị ghi dở do tắt đột ngột, bỏ qua
+                return
+            yield self.entry_codec.loads(data)
+
+    def _replay(self, records: List[Dict]) -> List[Dict]:
+        self._entries = 0
+        try:
+            f = open(self.journal_path, 'rb')
+        except FileNotFoundError:
+            return records
+
+        by_key = {record[self.key]: record for record in records}
+        with f:
+            for entry in self._read_entries(f):
+                self._entries += 1
+                if entry['op'] == 'put':
+                    by_key[entry['key']] = entry['record']
+                elif entry['op'] == 'del':
+                    by_key.pop(entry['key'], None)
+        return list(by_key.values())
+
+    def _write(self, records: List[Dict], changed: Optional[Iterable[Dict]], deleted: Iterable[str]):
+        if changed is None and not deleted:
+            self.compact(records)
+            return
+
+        entries = [{"op": "put", "key": record[self.key], "record": self._encode(record)} for record in (changed or ())]
+        entries += [{"op": "del", "key": key} for key in deleted]
+        if not entries:
+            return
+
+        if self._journal is None:
+            self._journal = open(self.journal_path, 'ab')
+        self._journal.write(b"".join(self._encode_entry(entry) for entry in entries))
+        self._journal.flush()
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+
+        self._entries += len(entries)
+        if self._entries >= max(self.compact_every, len(records)):
+            self.compact(records)
+
+    def compact(self, records: List[Dict]):
+        """
+        Ghi bản chụp đầy đủ (ghi file tạm rồi đổi tên) và làm rỗng nhật ký
+        """
+        self._write_snapshot(records)
+
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self._entries = 0
+
+    def close(self, records: Optional[List[Dict]] = None):
+        if records is not None and self._entries:
+            self.compact(records)
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        super().close(records)
+
+
+class ShardedStore(JsonStore):
+    """
+    Chia tập bản ghi thành nhiều file <tên>.shard<i><đuôi> theo giá trị băm của khóa.
+    Mỗi lần lưu chỉ ghi lại các shard có bản ghi thay đổi; khi nạp, các shard được đọc song song.
+    Thứ tự bản ghi sau khi nạp là thứ tự theo khóa (mã tăng dần).
+    """
+    def __init__(self, path: str, key: str, codec=None, shards: int = 16):
+        super().__init__(path, key, codec)
+        self.shards = shards
+        self._members = [{} for _ in range(shards)]
+
+    def shard_of(self, record_key: str) -> int:
+        return zlib.crc32(record_key.encode('utf-8')) % self.shards
+
+    def shard_path(self, index: int) -> str:
+        stem, ext = os.path.splitext(self.path)
+        return f"{stem}.shard{index}{ext}"
+
+    def _load_shard(self, index: int) -> List[Dict]:
+        try:
+            with open(self.shard_path(index), 'rb') as f:
+                return self.codec.loads(f.read())
+        except FileNotFoundError:
+            return []
+
+    def _source_paths(self) -> List[str]:
+        return [self.shard_path(i) for i in range(self.shards)]
+
+    def _after_load(self, records: List[Dict]):
+        self._members = [{} for _ in range(self.shards)]
+        for record in records:
+            self._members[self.shard_of(record[self.key])][record[self.key]] = record
+
+    def _load_source(self) -> List[Dict]:
+        if not any(os.path.exists(self.shard_path(i)) for i in range(self.shards)):
+            # Chuyển từ file nguyên khối sang dạng shard ở lần nạp đầu tiên
+            records = super()._load_source()
+            self._write(records, None, ())
+            return records
+
+        with ThreadPoolExecutor(max_workers=min(self.shards, 8)) as pool:
+            shards = list(pool.map(self._load_shard, range(self.shards)))
+        self._members = [{record[self.key]: record for record in shard} for shard in shards]
+        return sorted((record for shard in shards for record in shard), key=lambda r: r[self.key])
+
+    def _write(self, records: List[Dict], changed: Optional[Iterable[Dict]], deleted: Iterable[str]):
+        if changed is None and not deleted:
+            self._after_load(records)
+            touched = set(range(self.shards))
+        else:
+            touched = set()
+            for record in changed or ():
+                index = self.shard_of(record[self.key])
+                self._members[index][record[self.key]] = record
+                touched.add(index)
+            for record_key in deleted:
+                index = self.shard_of(record_key)
+                self._members[index].pop(record_key, None)
+                touched.add(index)
+
+        for index in touched:
+            tmp_path = self.shard_path(index) + ".tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(self.codec.dumps([self._encode(r) for r in self._members[index].values()]))
+            os.replace(tmp_path, self.shard_path(index))
+
+    def compact(self, records: List[Dict]):
+        self._write(records, None, ())
+
+
+class SqliteStore(JsonStore):
+    """
+    Lưu mỗi tập bản ghi thành một bảng trong file SQLite (mặc định library.db cùng thư mục).
+    Mỗi bản ghi là một dòng: nội dung JSON kèm các cột được đánh chỉ mục để truy vấn trực tiếp.
+    Một lần lưu chỉ ghi các dòng bị thay đổi.
+    """
+    INDEXED_COLUMNS = ("reader_id", "doc_id", "borrow_id", "status", "due_date")
+
+    def __init__(self, path: str, key: str, db_file: Optional[str] = None):
+        super().__init__(path, key)
+        self.db_file = db_file or os.path.join(os.path.dirname(path), "library.db")
+        self.table = re.sub(r'\W', '_', os.path.splitext(os.path.basename(path))[0])
+        self._conn = None
+        # Kết nối được dùng chung với luồng ghi nền nên mọi truy cập đều đi qua khóa này
+        self._db_lock = threading.RLock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_file, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        return self._conn
+
+    def _table_exists(self) -> bool:
+        row = self._connect().execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (self.table,)).fetchone()
+        return row is not None
+
+    def _create_table(self):
+        conn = self._connect()
+        columns = ", ".join(f"{column} TEXT" for column in self.INDEXED_COLUMNS)
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                     f"record_key TEXT PRIMARY KEY, position INTEGER NOT NULL, {columns}, data TEXT NOT NULL)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_position ON {self.table} (position)")
+        for column in self.INDEXED_COLUMNS:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_{column} ON {self.table} ({column})")
+
+    def _load_source(self) -> List[Dict]:
+        with self._db_lock:
+            if not self._table_exists():
+                raise FileNotFoundError(f"Chưa có bảng {self.table} trong {self.db_file}")
+            rows = self._connect().execute(f"SELECT data FROM {self.table} ORDER BY position")
+            return [json.loads(data) for (data,) in rows]
+
+    def _row(self, record: Dict, position: Optional[int] = None) -> tuple:
+        values = tuple(record.get(column) for column in self.INDEXED_COLUMNS)
+        row = (record[self.key],) + values + (json.dumps(self._encode(record), ensure_ascii=False),)
+        return row if position is None else row + (position,)
+
+    def _write(self, records: List[Dict], changed: Optional[Iterable[Dict]], deleted: Iterable[str]):
+        with self._db_lock:
+            self._write_rows(records, changed, deleted)
+
+    def _write_rows(self, records: List[Dict], changed: Optional[Iterable[Dict]], deleted: Iterable[str]):
+        self._create_table()
+        conn = self._connect()
+        columns = ", ".join(self.INDEXED_COLUMNS)
+        placeholders = ", ".join("?" for _ in self.INDEXED_COLUMNS)
+        with conn:
+            if changed is None and not deleted:
+                conn.execute(f"DELETE FROM {self.table}")
+                conn.executemany(
+                    f"INSERT INTO {self.table} (record_key, {columns}, data, position) "
+                    f"VALUES (?, {placeholders}, ?, ?)",
+                    [self._row(record, position) for position, record in enumerate(records)])
+                return
+
+            updates = ", ".join(f"{column} = excluded.{column}" for column in self.INDEXED_COLUMNS)
+            conn.executemany(
+                f"INSERT INTO {self.table} (record_key, {columns}, data, position) "
+                f"VALUES (?, {placeholders}, ?, (SELECT COALESCE(MAX(position), -1) + 1 FROM {self.table})) "
+                f"ON CONFLICT(record_key) DO UPDATE SET {updates}, data = excluded.data",
+                [self._row(record) for record in (changed or ())])
+            conn.executemany(f"DELETE FROM {self.table} WHERE record_key = ?", [(key,) for key in deleted])
+
+    def compact(self, records: List[Dict]):
+        self._write(records, None, ())
+
+    def close(self, records: Optional[List[Dict]] = None):
+        with self._db_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class DetailsStore(JsonStore):
+    """
+    Lưu các trường nặng (mảng lịch sử) của mỗi bản ghi thành một file riêng <directory>/<key>.json
+    theo định dạng của codec (mặc định JSON thụt lề 4 như trước đây).
+    Chỉ các bản ghi đã nạp phần chi tiết mới được ghi lại.
+    """
+    def __init__(self, directory: str, key: str, fields: Iterable[str], codec=None):
+        super().__init__(directory, key, codec)
+        self.fields = tuple(fields)
+
+    def _detail_path(self, record_key: str) -> str:
+        return os.path.join(self.path, f"{record_key}.json")
+
+    def load(self) -> List[Dict]:
+        return []
+
+    def load_details(self, record_key: str) -> Dict:
+        try:
+            with open(self._detail_path(record_key), 'rb') as f:
+                return self.codec.loads(f.read())
+        except FileNotFoundError:
+            return {}
+
+    def summary(self, record: Dict) -> Dict:
+        return {k: v for k, v in record.items() if k not in self.fields}
+
+    def _write(self, records: List[Dict], changed: Optional[Iterable[Dict]], deleted: Iterable[str]):
+        os.makedirs(self.path, exist_ok=True)
+        for record in (records if changed is None else changed):
+            # Dùng dict.__contains__ để không kích hoạt việc nạp chi tiết của LazyRecord
+            details = {field: record[field] for field in self.fields if dict.__contains__(record, field)}
+            if not details:
+                continue
+            tmp_path = self._detail_path(record[self.key]) + ".tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(self.codec.dumps(details))
+            os.replace(tmp_path, self._detail_path(record[self.key]))
+        for record_key in deleted:
+            if os.path.exists(self._detail_path(record_key)):
+                os.remove(self._detail_path(record_key))
+
+    def compact(self, records: List[Dict]):
+        self._write(records, None, ())
+
+
+class LazyRecord(dict):
+    """
+    Bản ghi chỉ chứa phần tóm tắt; các trường chi tiết được nạp từ DetailsStore ở lần truy cập đầu tiên
+    """
+    def __init__(self, data: Dict, details_store: DetailsStore, defaults: Optional[Dict] = None):
+        super().__init__(data)
+        self._details_store = details_store
+        self._defaults = defaults or {}
+        self._details_loaded = all(dict.__contains__(self, field) for field in details_store.fields)
+
+    def _load_details(self):
+        if self._details_loaded:
+            return
+        self._details_loaded = True
+        details = self._details_store.load_details(self[self._details_store.key])
+        for field in self._details_store.fields:
+            if field in details:
+                self.setdefault(field, details[field])
+            elif field in self._defaults:
+                self.setdefault(field, list(self._defaults[field]))
+
+    def __missing__(self, key):
+        if key in self._details_store.fields and not self._details_loaded:
+            self._load_details()
+            if dict.__contains__(self, key):
+                return dict.__getitem__(self, key)
+        raise KeyError(key)
+
+    def __contains__(self, key) -> bool:
+        if key in self._details_store.fields:
+            self._load_details()
+        return dict.__contains__(self, key)
+
+    def get(self, key, default=None):
+        if key in self._details_store.fields:
+            self._load_details()
+        return dict.get(self, key, default)
+
+
+def open_store(path: str, key: Optional[str] = None, storage: str = "json", codec: str = "json",
+               snapshot: bool = False) -> JsonStore:
+    """
+    Tạo đối tượng lưu trữ cho một tập bản ghi theo chế độ lưu trữ và định dạng file đã chọn.
+    snapshot=True bật bản chụp nhị phân để khởi động nhanh (không áp dụng cho SQLite).
+    """
+    if storage == "json" or key is None:
+        store = JsonStore(path, key, get_codec(codec))
+    elif storage == "journal":
+        store = JournalStore(path, key, get_codec(codec))
+    elif storage == "sqlite":
+        return SqliteStore(path, key)
+    elif storage == "sharded":
+        store = ShardedStore(path, key, get_codec(codec))
+    else:
+        raise ValueError(f"Chế độ lưu trữ '{storage}' không được hỗ trợ")
+    if snapshot:
+        store.snapshot_path = path + ".snap"
+    return store
+
+
+@contextmanager
+def transaction(*managers):
+    """
+    Gom mọi thay đổi của các manager trong một thao tác và ghi mỗi file đúng một lần khi kết thúc.
+    Nếu có lỗi giữa chừng, các thay đổi chưa ghi bị hủy và dữ liệu trong bộ nhớ được nạp lại từ đĩa.
+    Nhật ký thao tác của các manager cũng chỉ được ghi khi giao dịch thành công.
+    Giao dịch lồng nhau được gộp vào giao dịch ngoài cùng.
+    """
+    stores = [(manager, attr, store) for manager in dict.fromkeys(managers)
+              for attr, store in manager._stores()]
+    logs = [manager.audit_log for manager in dict.fromkeys(managers) if getattr(manager, 'audit_log', None)]
+    with _write_lock:
+        for _, _, store in stores:
+            store.begin()
+        for log in logs:
+            log.begin()
+        try:
+            yield
+        except BaseException:
+            for _, _, store in stores:
+                store.rollback()
+            for log in logs:
+                log.rollback()
+            # Luôn nạp lại, kể cả khi chưa gọi lệnh lưu nào: thao tác có thể đã sửa bản ghi trong bộ nhớ
+            # rồi mới gặp lỗi kiểm tra, và lần lưu sau hoặc bản chụp khi đóng sẽ ghi trạng thái dở dang đó
+            if not any(store.in_transaction for _, _, store in stores):
+                # Ở chế độ ghi nền, ghi các thay đổi đã hoàn tất trước đó rồi mới nạp lại từ đĩa
+                for _, _, store in stores:
+                    store.flush_committed()
+                for manager in dict.fromkeys(manager for manager, _, _ in stores):
+                    manager._reload()
+            raise
+        else:
+            for manager, attr, store in stores:
+                # Không truy cập tập bản ghi không có thay đổi (có thể chưa được nạp)
+                store.commit(getattr(manager, attr) if store.has_pending else None)
+            for log in logs:
+                log.commit()
+
+
+def transactional(method):
+    """
+    Chạy một phương thức của manager trong transaction() gồm chính nó và các manager được truyền vào
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        managers = [self] + [arg for arg in list(args) + list(kwargs.values()) if hasattr(arg, '_stores')]
+        with transaction(*managers):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class WriteBehindFlusher:
+    """
+    Ghi nền cho các manager: thay đổi chỉ được đánh dấu, một luồng nền gom lại và ghi xuống đĩa
+    sau tối đa interval_ms mili giây hoặc khi đủ max_mutations thay đổi.
+    Luôn ghi hết khi gọi close() và khi trình thông dịch thoát.
+    """
+    def __init__(self, manager, interval_ms: int = 200, max_mutations: int = 100):
+        self.manager = manager
+        self.interval = interval_ms / 1000
+        self.max_mutations = max_mutations
+        self._wakeup = threading.Event()
+        self._stopped = False
+        for _, store in manager._stores():
+            store.flusher = self
+        self._thread = threading.Thread(target=self._run, name="write-behind-flusher", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def notify(self, mutations: int):
+        if mutations >= self.max_mutations:
+            self._wakeup.set()
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        with _write_lock:
+            for attr, store in self.manager._stores():
+                if store._behind:
+                    store.flush(getattr(self.manager, attr))
+
+    def close(self):
+        if self._stopped:
+            return
+        self._stopped = True
+        self._wakeup.set()
+        self._thread.join()
+        self.flush()
+        for _, store in self.manager._stores():
+            store.flusher = None
+        atexit.unregister(self.close)
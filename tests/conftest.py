@@ -0,0 +1,55 @@
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from reader_manager import ReaderManager
+from document_manager import DocumentManager
+from borrowing_manager import BorrowingManager
+
+STORAGE_MODES = {
+    "json": {},
+    "journal": {"storage": "journal"},
+    "sqlite": {"storage": "sqlite"},
+    "sharded": {"storage": "sharded"},
+    "snapshot": {"snapshot": True},
+    "write_behind": {"write_behind_ms": 20},
+}
+
+
+def pytest_configure(config):
+    # fuzzywuzzy cảnh báo khi thiếu python-Levenshtein; không ảnh hưởng kết quả
+    config.addinivalue_line("filterwarnings", "ignore:Using slow pure-python SequenceMatcher")
+
+
+@pytest.fixture
+def make_managers(tmp_path):
+    """
+    Tạo bộ ba manager trên thư mục tạm; gọi lại với cùng tham số để mô phỏng khởi động lại
+    """
+    created = []
+
+    def make(lazy_details: bool = False, **options):
+        reader_manager = ReaderManager(str(tmp_path / "users.json"), os.path.join(ROOT, "reader_types.json"),
+                                       str(tmp_path / "reader_logs.json"), lazy_details=lazy_details, **options)
+        doc_manager = DocumentManager(str(tmp_path / "documents.json"), str(tmp_path / "document_requests.json"),
+                                      str(tmp_path / "document_logs.json"), str(tmp_path / "document_categories.json"),
+                                      str(tmp_path / "document_ratings.json"), **options)
+        borrowing_manager = BorrowingManager(str(tmp_path / "borrow_records.json"),
+                                             str(tmp_path / "return_records.json"),
+                                             str(tmp_path / "borrowing_logs.json"),
+                                             str(tmp_path / "reservation_records.json"), **options)
+        created.extend((reader_manager, doc_manager, borrowing_manager))
+        return reader_manager, doc_manager, borrowing_manager
+
+    yield make
+    for manager in created:
+        manager.close()
+
+
+def register(reader_manager, full_name: str = "Nguyễn Văn A", number: int = 1):
+    return reader_manager.register_reader(full_name, f"12345{number:04d}", None, "0901234567",
+                                          f"reader{number}@example.com", "Hà Nội", "Sinh viên",
+                                          student_id=f"SV{number:04d}")
@@ -0,0 +1,48 @@
+import json
+
+from conftest import register
+
+
+def test_reopened_borrow_record_keeps_its_place(make_managers):
+    reader_manager, doc_manager, borrowing_manager = make_managers()
+    reader = register(reader_manager)
+    docs = [doc_manager.add_document(title, "Sách", 2) for title in ("Lập trình Python", "Cơ sở dữ liệu")]
+    first, second = [borrowing_manager.create_borrow_record(reader['reader_id'], [doc['doc_id']],
+                                                            reader_manager, doc_manager) for doc in docs]
+    returned = borrowing_manager.create_return_record(first['borrow_id'], [docs[0]['doc_id']],
+                                                      reader_manager, doc_manager)
+    assert [r['borrow_id'] for r in borrowing_manager.get_unreturned_borrow_records()] == [second['borrow_id']]
+
+    # Xóa phiếu trả đưa phiếu mượn đầu quay lại nhóm 'borrowed' ở đúng vị trí của nó trong danh sách
+    borrowing_manager.delete_return_record(returned['return_id'], reader_manager, doc_manager)
+    unreturned = borrowing_manager.get_unreturned_borrow_records()
+    assert [r['borrow_id'] for r in unreturned] == [first['borrow_id'], second['borrow_id']]
+    assert [r['stt'] for r in unreturned] == [1, 2]
+
+    _, _, reopened = make_managers()
+    assert [r['borrow_id'] for r in reopened.get_unreturned_borrow_records()] == [first['borrow_id'],
+                                                                                 second['borrow_id']]
+
+
+def test_pending_reservations_follow_list_order(make_managers, tmp_path):
+    reader_manager, doc_manager, borrowing_manager = make_managers()
+    borrower = register(reader_manager, "Nguyễn Văn A", 1)
+    readers = [register(reader_manager, name, number) for number, name in ((2, "Trần Thị B"), (3, "Lê Văn C"))]
+    reservations = []
+    for reader, title in zip(readers, ("Lập trình Python", "Cơ sở dữ liệu")):
+        doc = doc_manager.add_document(title, "Sách", 1)
+        borrowing_manager.create_borrow_record(borrower['reader_id'], [doc['doc_id']], reader_manager, doc_manager)
+        reservations.append(borrowing_manager.create_reservation(reader['reader_id'], doc['doc_id'],
+                                                                 reader_manager, doc_manager))
+    expected = [res['reservation_id'] for res in reservations]
+    borrowing_manager.close()
+
+    # Ngày đặt không theo thứ tự danh sách: danh sách chờ vẫn theo thứ tự bản ghi như trước đây
+    path = tmp_path / "reservation_records.json"
+    records = json.loads(path.read_text(encoding="utf-8"))
+    records[0]['reservation_date'], records[1]['reservation_date'] = \
+        records[1]['reservation_date'], records[0]['reservation_date']
+    path.write_text(json.dumps(records, ensure_ascii=False, indent=4), encoding="utf-8")
+
+    _, _, reopened = make_managers()
+    assert [res['reservation_id'] for res in reopened.get_pending_reservations()] == expected
@@ -0,0 +1,36 @@
+import pytest
+
+from conftest import STORAGE_MODES
+
+
+def test_invalid_update_leaves_document_unchanged(make_managers):
+    _, doc_manager, _ = make_managers()
+    doc = doc_manager.add_document("Lập trình Python", "Sách", 2)
+
+    with pytest.raises(ValueError):
+        doc_manager.update_document(doc['doc_id'], {"title": "Cấu trúc dữ liệu", "SoLuong": -1})
+
+    assert doc_manager.get_document_details(doc['doc_id'])['title'] == "LẬP TRÌNH PYTHON"
+    assert [d['doc_id'] for d in doc_manager.search_documents(title="lap trinh")] == [doc['doc_id']]
+    assert doc_manager.search_documents(title="cau truc du lieu") == []
+
+
+@pytest.mark.parametrize("options", list(STORAGE_MODES.values()), ids=list(STORAGE_MODES))
+def test_failed_update_rolls_back(make_managers, monkeypatch, options):
+    _, doc_manager, _ = make_managers(**options)
+    doc = doc_manager.add_document("Lập trình Python", "Sách", 2)
+    title = doc['title']
+
+    def fail(entry):
+        raise OSError("ổ đĩa đầy")
+
+    monkeypatch.setattr(doc_manager.audit_log, "append", fail)
+    with pytest.raises(OSError):
+        doc_manager.update_document(doc['doc_id'], {"title": "Cấu trúc dữ liệu"})
+    monkeypatch.undo()
+
+    assert doc_manager.get_document_details(doc['doc_id'])['title'] == title
+    assert doc_manager.search_documents(title="cau truc du lieu") == []
+    doc_manager.close()
+    _, reopened, _ = make_managers(**options)
+    assert reopened.get_document_details(doc['doc_id'])['title'] == title
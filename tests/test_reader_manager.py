@@ -0,0 +1,98 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import register
+
+
+def test_legacy_loan_without_book_id_is_skipped(make_managers, tmp_path):
+    reader_manager, _, _ = make_managers()
+    reader = register(reader_manager)
+    reader_manager.close()
+
+    # Mục lịch sử theo định dạng cũ (doc_id thay vì book_id), như DG00073 trong users.json
+    path = tmp_path / "users.json"
+    readers = json.loads(path.read_text(encoding="utf-8"))
+    readers[0]['borrow_history'].append({
+        "doc_id": "TL00001", "borrow_date": "2025-04-20T20:48:31", "due_date": "2025-05-04T20:48:31",
+        "return_date": None, "status": "borrowed"
+    })
+    path.write_text(json.dumps(readers, ensure_ascii=False, indent=4), encoding="utf-8")
+
+    reader_manager, _, _ = make_managers()
+    now = datetime.now()
+    reader_manager.add_borrow_record(reader['reader_id'], "TL001", now.isoformat(), (now + timedelta(days=7)).isoformat())
+    assert reader_manager.get_overdue_readers() == []
+    reader_manager.return_book(reader['reader_id'], "TL001", now.isoformat())
+
+    details = reader_manager.get_reader_details(reader['reader_id'])
+    assert [record['status'] for record in details['borrow_history']] == ["borrowed", "returned"]
+    assert reader_manager.find_active_loan(details, "TL001") is None
+
+
+def borrow(reader_manager, reader, book_id: str, days_overdue: int):
+    borrowed = datetime.now() - timedelta(days=days_overdue + 14)
+    reader_manager.add_borrow_record(reader['reader_id'], book_id, borrowed.isoformat(),
+                                     (borrowed + timedelta(days=14)).isoformat())
+
+
+def test_overdue_readers_keep_reader_order(make_managers):
+    reader_manager, _, _ = make_managers()
+    first = register(reader_manager, "Nguyễn Văn A", 1)
+    second = register(reader_manager, "Trần Thị B", 2)
+    borrow(reader_manager, first, "TL001", 2)
+    borrow(reader_manager, first, "TL002", 9)
+    borrow(reader_manager, second, "TL003", 20)
+
+    overdue = reader_manager.get_overdue_readers()
+    assert [(r['reader_id'], r['book_id']) for r in overdue] == [
+        (first['reader_id'], "TL001"), (second['reader_id'], "TL003")]
+
+
+def test_deleted_reader_leaves_overdue_scan(make_managers):
+    reader_manager, _, _ = make_managers()
+    reader = register(reader_manager)
+    borrow(reader_manager, reader, "TL001", 3)
+    assert len(reader_manager.get_overdue_readers()) == 1
+
+    # Dữ liệu cũ không nhất quán: còn lượt mượn mở nhưng borrowed_books đã về 0
+    reader_manager.get_reader_details(reader['reader_id'])['borrowed_books'] = 0
+    reader_manager.delete_reader(reader['reader_id'])
+    assert reader_manager.get_overdue_readers() == []
+
+
+def test_full_email_still_matches_as_substring(make_managers):
+    reader_manager, _, _ = make_managers()
+    tran = register(reader_manager, "Trần Văn B", 1)
+    an = register(reader_manager, "Lê Văn An", 2)
+    reader_manager.update_reader(tran['reader_id'], {"email": "tran@gmail.com"})
+    reader_manager.update_reader(an['reader_id'], {"email": "an@gmail.com"})
+
+    found = reader_manager.search_readers(email="an@gmail.com")
+    assert [r['reader_id'] for r in found] == [tran['reader_id'], an['reader_id']]
+    assert [r['reader_id'] for r in reader_manager.search_readers(email="AN@gmail.com")] == \
+        [tran['reader_id'], an['reader_id']]
+    assert [r['reader_id'] for r in reader_manager.search_readers(email="tran@gmail.com")] == [tran['reader_id']]
+
+
+def test_update_reader_keeps_unique_indexes(make_managers):
+    reader_manager, _, _ = make_managers()
+    first = register(reader_manager, "Nguyễn Văn A", 1)
+    second = register(reader_manager, "Trần Thị B", 2)
+
+    for updates in ({"email": "READER1@example.com"}, {"id_card": first['id_card']},
+                    {"student_id": first['student_id']}):
+        with pytest.raises(ValueError):
+            reader_manager.update_reader(second['reader_id'], updates)
+
+    # Giữ nguyên giá trị của chính mình không bị coi là trùng
+    assert reader_manager.update_reader(first['reader_id'], {"email": first['email'], "phone": "0907654321"})
+
+    # Giá trị cũ được giải phóng, giá trị mới được đánh chỉ mục
+    reader_manager.update_reader(first['reader_id'], {"email": "moi@example.com", "id_card": "987654321"})
+    assert reader_manager.search_readers(id_number=first['id_card']) == []
+    assert [r['reader_id'] for r in reader_manager.search_readers(id_number="987654321")] == [first['reader_id']]
+    assert [r['reader_id'] for r in reader_manager.search_readers(email="moi@example.com")] == [first['reader_id']]
+    reader_manager.update_reader(second['reader_id'], {"email": first['email'], "id_card": first['id_card']})
+    assert [r['reader_id'] for r in reader_manager.search_readers(id_number=first['id_card'])] == [second['reader_id']]
@@ -0,0 +1,158 @@
+import random
+
+import pytest
+from fuzzywuzzy import fuzz
+
+from conftest import register
+from search_index import SearchCache, search_key
+
+WORDS = ["lập", "trình", "python", "cơ", "sở", "dữ", "liệu", "mạng", "máy", "tính"]
+
+
+@pytest.fixture
+def catalog(make_managers):
+    reader_manager, doc_manager, _ = make_managers()
+    rng = random.Random(1)
+    for _ in range(60):
+        doc_manager.add_document(" ".join(rng.choice(WORDS) for _ in range(3)), "Sách", 1)
+    for number, name in enumerate(["Nguyễn Văn An", "Lê Thị Bình", "Nguyễn Thị An", "Trần Văn Bình"], 1):
+        register(reader_manager, name, number)
+    return reader_manager, doc_manager
+
+
+@pytest.mark.parametrize("min_parallel_work", [None, 0], ids=["in_process", "pool"])
+def test_batch_matching_agrees_with_ranked_search(catalog, min_parallel_work):
+    reader_manager, doc_manager = catalog
+    if min_parallel_work is not None:
+        doc_manager.batch_matcher.min_parallel_work = min_parallel_work
+        reader_manager.batch_matcher.min_parallel_work = min_parallel_work
+    titles = ["lap trinh", "MẠNG máy tính", "zzz"]
+    names = ["nguyen van an", "binh"]
+
+    matched = doc_manager.match_titles(titles, min_similarity=70, limit=5, workers=2)
+    assert [m['matches'] for m in matched] == [
+        doc_manager.rank_documents(title=t, min_similarity=70, limit=5)['results'] for t in titles]
+    matched = reader_manager.match_names(names, min_similarity=70, workers=2)
+    assert [m['matches'] for m in matched] == [
+        reader_manager.rank_readers(full_name=n, min_similarity=70, limit=5)['results'] for n in names]
+
+
+def test_batch_matcher_reuses_pool_until_data_changes(catalog):
+    _, doc_manager = catalog
+    matcher = doc_manager.batch_matcher
+    matcher.min_parallel_work = 0
+
+    doc_manager.match_titles(["lap trinh"], workers=2)
+    pool = matcher._pool
+    assert pool is not None
+    doc_manager.match_titles(["co so du lieu"], workers=2)
+    assert matcher._pool is pool
+
+    added = doc_manager.add_document("Lập trình hướng đối tượng", "Sách", 1)
+    matched = doc_manager.match_titles(["lap trinh huong doi tuong"], limit=1, workers=2)
+    assert matcher._pool is not pool
+    assert matched[0]['matches'][0]['doc_id'] == added['doc_id']
+
+
+def test_small_batches_are_matched_in_process(catalog):
+    _, doc_manager = catalog
+    doc_manager.match_titles(["lap trinh"], workers=2)
+    assert doc_manager.batch_matcher._pool is None
+
+
+def collect_pages(rank, limit: int, **criteria) -> list:
+    results, cursor = [], None
+    while True:
+        page = rank(limit=limit, cursor=cursor, **criteria)
+        assert len(page['results']) <= limit
+        results += page['results']
+        cursor = page['next_cursor']
+        if cursor is None:
+            return results
+
+
+@pytest.mark.parametrize("title", ["lap trinh", "mang may", None])
+def test_cursor_pages_cover_ranked_results_exactly_once(catalog, title):
+    _, doc_manager = catalog
+    # Thứ tự mong đợi: điểm giảm dần, cùng điểm thì theo thứ tự danh mục (sắp xếp ổn định)
+    def score(doc):
+        return fuzz.partial_ratio(search_key(title), search_key(doc['title'])) if title else 100
+    expected = sorted(doc_manager.search_documents(title=title, min_similarity=60), key=lambda doc: -score(doc))
+    paged = collect_pages(doc_manager.rank_documents, 7, title=title, min_similarity=60)
+
+    assert [doc['doc_id'] for doc in paged] == [doc['doc_id'] for doc in expected]
+    scores = [doc['score'] for doc in paged]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_reader_pages_and_scores(catalog):
+    reader_manager, _ = catalog
+    paged = collect_pages(reader_manager.rank_readers, 1, full_name="nguyen")
+    assert [r['full_name'] for r in paged] == ["NGUYỄN VĂN AN", "NGUYỄN THỊ AN"]
+    assert all(r['score'] == 100 for r in paged)
+
+
+def test_invalid_cursor_is_rejected(catalog):
+    _, doc_manager = catalog
+    with pytest.raises(ValueError):
+        doc_manager.rank_documents(cursor="trang-2")
+    with pytest.raises(ValueError):
+        doc_manager.rank_documents(limit=0)
+
+
+def test_search_cache_hits_for_equivalent_queries(catalog):
+    _, doc_manager = catalog
+    first = doc_manager.search_documents(title="du lieu")
+    again = doc_manager.search_documents(title="DỮ LIỆU")
+    assert first and again == first
+    assert (doc_manager.search_cache.hits, doc_manager.search_cache.misses) == (1, 1)
+
+    # Kết quả trả về là bản sao: sửa chúng không làm hỏng bộ nhớ đệm
+    again[0]['title'] = "đã sửa"
+    assert doc_manager.search_documents(title="du lieu") == first
+
+
+def test_search_cache_is_invalidated_by_mutations(make_managers):
+    reader_manager, doc_manager, borrowing_manager = make_managers()
+    reader = register(reader_manager)
+    doc = doc_manager.add_document("Lập trình Python", "Sách", 2)
+    assert doc_manager.search_documents(title="lap trinh")[0]['AvailableQuantity'] == 2
+    assert reader_manager.search_readers(full_name="nguyen")[0]['borrowed_books'] == 0
+
+    borrowing_manager.create_borrow_record(reader['reader_id'], [doc['doc_id']], reader_manager, doc_manager)
+    assert doc_manager.search_documents(title="lap trinh")[0]['AvailableQuantity'] == 1
+    assert reader_manager.search_readers(full_name="nguyen")[0]['borrowed_books'] == 1
+
+    added = doc_manager.add_document("Lập trình C", "Sách", 1)
+    assert added['doc_id'] in [d['doc_id'] for d in doc_manager.search_documents(title="lap trinh")]
+    doc_manager.update_document(doc['doc_id'], {"title": "Toán rời rạc"})
+    assert doc['doc_id'] not in [d['doc_id'] for d in doc_manager.search_documents(title="lap trinh")]
+    register(reader_manager, "Nguyễn Thị B", 2)
+    assert len(reader_manager.search_readers(full_name="nguyen")) == 2
+
+
+def test_search_cache_is_invalidated_by_rollback(make_managers, monkeypatch):
+    _, doc_manager, _ = make_managers()
+    doc = doc_manager.add_document("Lập trình Python", "Sách", 2)
+    assert len(doc_manager.search_documents(title="cau truc du lieu")) == 0
+
+    def fail(entry):
+        raise OSError("ổ đĩa đầy")
+
+    # Trong lúc thao tác dở dang, tiêu đề mới đã được đưa vào chỉ mục rồi bị hoàn tác
+    monkeypatch.setattr(doc_manager.audit_log, "append", fail)
+    with pytest.raises(OSError):
+        doc_manager.update_document(doc['doc_id'], {"title": "Cấu trúc dữ liệu"})
+    monkeypatch.undo()
+    assert doc_manager.search_documents(title="cau truc du lieu") == []
+    assert [d['doc_id'] for d in doc_manager.search_documents(title="lap trinh")] == [doc['doc_id']]
+
+
+def test_search_cache_evicts_least_recently_used(make_managers):
+    _, doc_manager, _ = make_managers()
+    doc_manager.search_cache = SearchCache(2)
+    doc_manager.add_document("Lập trình Python", "Sách", 2)
+    for title in ("lap trinh", "python", "lap trinh", "toan"):
+        doc_manager.search_documents(title=title)
+    doc_manager.search_documents(title="python")
+    assert doc_manager.search_cache.stats() == {"hits": 1, "misses": 4, "size": 2, "maxsize": 2}
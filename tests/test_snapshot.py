@@ -0,0 +1,43 @@
+import json
+import os
+
+from snapshot import read_snapshot, source_stamps, write_snapshot
+
+
+def test_snapshot_is_used_while_sources_are_unchanged(tmp_path):
+    source = tmp_path / "documents.json"
+    source.write_text("[]", encoding="utf-8")
+    path = str(tmp_path / "documents.json.snap")
+
+    write_snapshot(path, [{"doc_id": "TL001"}], source_stamps([str(source)]))
+    assert read_snapshot(path, [str(source)]) == [{"doc_id": "TL001"}]
+
+
+def test_edit_in_the_same_clock_tick_invalidates_snapshot(make_managers, tmp_path):
+    _, doc_manager, _ = make_managers(snapshot=True)
+    doc = doc_manager.add_document("Lập trình Python", "Sách", 2)
+    doc_manager.close()
+    _, doc_manager, _ = make_managers(snapshot=True)
+    assert os.path.exists(str(tmp_path / "documents.json.snap"))
+
+    # Sửa file JSON bằng tay nhưng giữ nguyên mtime, như trên hệ thống file có độ phân giải thời gian thấp
+    path = tmp_path / "documents.json"
+    stat = os.stat(path)
+    documents = json.loads(path.read_text(encoding="utf-8"))
+    documents[0]['title'] = "CẤU TRÚC DỮ LIỆU VÀ GIẢI THUẬT"
+    path.write_text(json.dumps(documents, ensure_ascii=False, indent=4), encoding="utf-8")
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    _, reopened, _ = make_managers(snapshot=True)
+    assert reopened.get_document_details(doc['doc_id'])['title'] == "CẤU TRÚC DỮ LIỆU VÀ GIẢI THUẬT"
+
+
+def test_corrupt_snapshot_is_ignored(tmp_path):
+    source = tmp_path / "documents.json"
+    source.write_text("[]", encoding="utf-8")
+    path = tmp_path / "documents.json.snap"
+
+    write_snapshot(str(path), [{"doc_id": "TL001"}], source_stamps([str(source)]))
+    content = path.read_bytes()
+    path.write_bytes(content[:-1] + bytes([content[-1] ^ 0xFF]))
+    assert read_snapshot(str(path), [str(source)]) is None
@@ -0,0 +1,164 @@
+import json
+import os
+import time
+import zlib
+
+import pytest
+
+from conftest import register
+from serialization import available_codecs, get_codec
+from storage import JournalStore, open_store
+
+
+def fail(entry):
+    raise OSError("ổ đĩa đầy")
+
+
+@pytest.mark.parametrize("storage", ["json", "journal", "sqlite", "sharded"])
+def test_failed_checkout_keeps_unflushed_commits(make_managers, monkeypatch, storage):
+    # Khoảng ghi nền dài để các thay đổi trước đó vẫn còn chờ khi thao tác sau thất bại
+    options = {"storage": storage, "write_behind_ms": 60_000}
+    reader_manager, doc_manager, borrowing_manager = make_managers(**options)
+    reader = register(reader_manager)
+    doc = doc_manager.add_document("Lập trình Python", "Sách", 2)
+
+    monkeypatch.setattr(borrowing_manager.audit_log, "append", fail)
+    with pytest.raises(OSError):
+        borrowing_manager.create_borrow_record(reader['reader_id'], [doc['doc_id']], reader_manager, doc_manager)
+    monkeypatch.undo()
+
+    assert reader_manager.get_reader_details(reader['reader_id'])['borrowed_books'] == 0
+    assert doc_manager.get_document_details(doc['doc_id'])['AvailableQuantity'] == 2
+    assert borrowing_manager.borrow_records == []
+
+    # Dữ liệu trên đĩa (chưa đóng manager nên không có lần ghi nền nào khác)
+    other_readers, other_docs, other_borrowing = make_managers(storage=storage)
+    assert other_readers.get_reader_details(reader['reader_id'])['borrowed_books'] == 0
+    assert other_docs.get_document_details(doc['doc_id'])['AvailableQuantity'] == 2
+    assert other_borrowing.borrow_records == []
+
+
+def test_later_commit_of_same_record_is_flushed_after_rollback(make_managers, monkeypatch):
+    _, doc_manager, _ = make_managers(write_behind_ms=60_000)
+    doc = doc_manager.add_document("Lập trình Python", "Sách", 2)
+    doc_manager.update_document(doc['doc_id'], {"SoLuong": 5})
+
+    monkeypatch.setattr(doc_manager.audit_log, "append", fail)
+    with pytest.raises(OSError):
+        doc_manager.update_document(doc['doc_id'], {"title": "Cấu trúc dữ liệu"})
+    monkeypatch.undo()
+
+    _, other_docs, _ = make_managers()
+    stored = other_docs.get_document_details(doc['doc_id'])
+    assert (stored['title'], stored['SoLuong']) == ("LẬP TRÌNH PYTHON", 5)
+
+
+def test_sqlite_write_behind_flushes_from_background_thread(make_managers):
+    _, doc_manager, _ = make_managers(storage="sqlite", write_behind_ms=10)
+    doc = doc_manager.add_document("Lập trình Python", "Sách", 2)
+
+    doc_manager.flusher._wakeup.set()
+    for _ in range(200):
+        if not doc_manager.documents_store._behind:
+            break
+        time.sleep(0.01)
+
+    assert doc_manager.flusher._thread.is_alive()
+    _, other_docs, _ = make_managers(storage="sqlite")
+    assert other_docs.get_document_details(doc['doc_id'])['title'] == doc['title']
+
+
+def test_journal_replays_changes_after_restart(make_managers, tmp_path):
+    _, doc_manager, _ = make_managers(storage="journal")
+    first = doc_manager.add_document("Lập trình Python", "Sách", 2)
+    second = doc_manager.add_document("Cấu trúc dữ liệu", "Sách", 1)
+    doc_manager.update_document(first['doc_id'], {"SoLuong": 4})
+    doc_manager.delete_document(second['doc_id'])
+    assert os.path.exists(str(tmp_path / "documents.json.journal"))
+
+    # Khởi động lại mà không đóng (không nén): dữ liệu chỉ có trong nhật ký
+    _, reopened, _ = make_managers(storage="journal")
+    assert reopened.get_document_details(first['doc_id'])['SoLuong'] == 4
+    assert reopened.get_document_details(second['doc_id']) is None
+
+
+def test_journal_entries_are_counted_when_loaded_from_snapshot(tmp_path):
+    path = str(tmp_path / "documents.json")
+    store = open_store(path, "doc_id", "journal", snapshot=True)
+    store.save([], [{"doc_id": "TL001"}, {"doc_id": "TL002"}])
+    store.save([], [{"doc_id": "TL003"}])
+    store.load()
+
+    reopened = open_store(path, "doc_id", "journal", snapshot=True)
+    assert [r['doc_id'] for r in reopened.load()] == ["TL001", "TL002", "TL003"]
+    assert reopened._entries == 3
+
+
+def test_journal_compaction_is_amortized_over_record_count(tmp_path):
+    store = JournalStore(str(tmp_path / "documents.json"), "doc_id", compact_every=2)
+    records = [{"doc_id": f"TL{i:03d}"} for i in range(5)]
+    for record in records:
+        store.save(records, [record])
+        # Chưa nén khi số dòng nhật ký còn ít hơn số bản ghi
+        assert os.path.exists(store.journal_path) == (record is not records[-1])
+    assert [r['doc_id'] for r in store.load()] == [r['doc_id'] for r in records]
+
+
+@pytest.mark.parametrize("codec", [name for name in available_codecs() if name != "json"])
+def test_journal_and_reader_details_use_the_codec(make_managers, tmp_path, codec):
+    options = {"storage": "journal", "codec": codec}
+    reader_manager, doc_manager, _ = make_managers(lazy_details=True, **options)
+    reader = register(reader_manager)
+    reader_manager.update_reader_info(reader['reader_id'], phone="0907654321")
+    doc = doc_manager.add_document("Lập trình Python", "Sách", 2)
+    doc_manager.update_document(doc['doc_id'], {"SoLuong": 4})
+
+    # Chi tiết độc giả và các mục nhật ký đều được ghi bằng codec đã chọn
+    with open(tmp_path / "reader_details" / f"{reader['reader_id']}.json", 'rb') as f:
+        data = f.read()
+    details = get_codec(codec).loads(data)
+    assert data == get_codec(codec).dumps(details)
+    assert details['update_history'][0]['new_values'] == {"phone": "0907654321"}
+    with open(tmp_path / "documents.json.journal", 'rb') as f:
+        lines = f.read().splitlines()
+    entries = [get_codec(codec).loads(line) for line in lines]
+    assert lines == [get_codec(codec).dumps(entry) for entry in entries]
+    assert [entry['op'] for entry in entries] == ["put", "put"]
+
+    # Khởi động lại từ nhật ký (chưa nén), rồi sau khi đóng (đã nén)
+    for close in (False, True):
+        if close:
+            for manager in (reader_manager, doc_manager):
+                manager.close()
+        reader_manager, doc_manager, _ = make_managers(lazy_details=True, **options)
+        details = reader_manager.get_reader_details(reader['reader_id'])
+        assert details['phone'] == "0907654321"
+        assert len(details['update_history']) == 1
+        assert doc_manager.get_document_details(doc['doc_id'])['SoLuong'] == 4
+
+
+class CompressedCodec:
+    name = "json-zlib"
+    binary = True
+
+    def dumps(self, obj) -> bytes:
+        return zlib.compress(json.dumps(obj).encode('utf-8'))
+
+    def loads(self, data: bytes):
+        return json.loads(zlib.decompress(data))
+
+
+def test_journal_frames_binary_entries(tmp_path):
+    path = str(tmp_path / "documents.json")
+    store = JournalStore(path, "doc_id", CompressedCodec())
+    store.save([], [{"doc_id": "TL001", "title": "Lập trình\nPython"}, {"doc_id": "TL002"}])
+    store.save([], [{"doc_id": "TL003"}], deleted=["TL002"])
+    # Mục cuối bị ghi dở do tắt đột ngột
+    with open(store.journal_path, 'ab') as f:
+        f.write(b"\x00\x00\x01\x00abc")
+
+    reopened = JournalStore(path, "doc_id", CompressedCodec())
+    assert reopened.load() == [{"doc_id": "TL001", "title": "Lập trình\nPython"}, {"doc_id": "TL003"}]
+    assert reopened._entries == 4
+    with open(store.journal_path, 'rb') as f:
+        assert JournalStore._count_frames(f) == 4
@@ -0,0 +1,134 @@
+import pytest
+
+from conftest import STORAGE_MODES, register
+from storage import transaction
+
+MODES = dict(STORAGE_MODES, lazy_details={"lazy_details": True})
+
+
+@pytest.fixture(params=list(MODES), ids=list(MODES))
+def options(request):
+    return MODES[request.param]
+
+
+def fail(entry):
+    raise OSError("ổ đĩa đầy")
+
+
+def stock(reader_manager, doc_manager):
+    reader = register(reader_manager)
+    doc = doc_manager.add_document("Lập trình Python", "Sách", 2)
+    return reader, doc
+
+
+def test_checkout_and_return_survive_restart(make_managers, options):
+    reader_manager, doc_manager, borrowing_manager = make_managers(**options)
+    reader, doc = stock(reader_manager, doc_manager)
+    borrow = borrowing_manager.create_borrow_record(reader['reader_id'], [doc['doc_id']], reader_manager, doc_manager)
+    for manager in (reader_manager, doc_manager, borrowing_manager):
+        manager.close()
+
+    reader_manager, doc_manager, borrowing_manager = make_managers(**options)
+    assert reader_manager.get_reader_details(reader['reader_id'])['borrowed_books'] == 1
+    assert doc_manager.get_document_details(doc['doc_id'])['AvailableQuantity'] == 1
+    assert borrowing_manager.get_borrow_record_details(borrow['borrow_id'])['status'] == "borrowed"
+
+    borrowing_manager.create_return_record(borrow['borrow_id'], [doc['doc_id']], reader_manager, doc_manager)
+    assert reader_manager.get_reader_details(reader['reader_id'])['borrowed_books'] == 0
+    assert doc_manager.get_document_details(doc['doc_id'])['AvailableQuantity'] == 2
+
+
+def test_failed_checkout_rolls_back_every_manager(make_managers, monkeypatch, options):
+    reader_manager, doc_manager, borrowing_manager = make_managers(**options)
+    reader, doc = stock(reader_manager, doc_manager)
+
+    # Lỗi xảy ra sau khi cả độc giả, tài liệu và phiếu mượn đã được sửa trong bộ nhớ
+    monkeypatch.setattr(borrowing_manager.audit_log, "append", fail)
+    with pytest.raises(OSError):
+        borrowing_manager.create_borrow_record(reader['reader_id'], [doc['doc_id']], reader_manager, doc_manager)
+    monkeypatch.undo()
+
+    for readers, docs, borrowing in ((reader_manager, doc_manager, borrowing_manager), make_managers(**options)):
+        details = readers.get_reader_details(reader['reader_id'])
+        assert details['borrowed_books'] == 0
+        assert readers.find_active_loan(details, doc['doc_id']) is None
+        assert docs.get_document_details(doc['doc_id'])['AvailableQuantity'] == 2
+        assert borrowing.borrow_records == []
+        assert borrowing.get_unreturned_borrow_records() == []
+
+    # Sau khi hoàn tác, thao tác kế tiếp vẫn chạy bình thường
+    borrowing_manager.create_borrow_record(reader['reader_id'], [doc['doc_id']], reader_manager, doc_manager)
+
+
+def test_failed_checkout_leaves_no_log_entries(make_managers, monkeypatch, options):
+    reader_manager, doc_manager, borrowing_manager = make_managers(**options)
+    reader, doc = stock(reader_manager, doc_manager)
+    reader_logs, doc_logs = len(reader_manager.logs), len(doc_manager.logs)
+
+    monkeypatch.setattr(borrowing_manager.audit_log, "append", fail)
+    with pytest.raises(OSError):
+        borrowing_manager.create_borrow_record(reader['reader_id'], [doc['doc_id']], reader_manager, doc_manager)
+    monkeypatch.undo()
+    assert len(reader_manager.logs) == reader_logs
+    assert len(doc_manager.logs) == doc_logs
+
+    borrow = borrowing_manager.create_borrow_record(reader['reader_id'], [doc['doc_id']], reader_manager, doc_manager)
+    assert [entry['action'] for entry in reader_manager.logs[reader_logs:]] == ["borrow", "notification"]
+    assert [entry['record_id'] for entry in borrowing_manager.logs] == [borrow['borrow_id']]
+    assert reader_manager.get_reader_details(reader['reader_id'])['borrowed_books'] == 1
+
+
+def test_validation_error_does_not_change_anything(make_managers, options):
+    reader_manager, doc_manager, borrowing_manager = make_managers(**options)
+    reader, doc = stock(reader_manager, doc_manager)
+
+    with pytest.raises(ValueError):
+        borrowing_manager.create_borrow_record(reader['reader_id'], [doc['doc_id'], "TL999"],
+                                               reader_manager, doc_manager)
+    assert reader_manager.get_reader_details(reader['reader_id'])['borrowed_books'] == 0
+    assert doc_manager.get_document_details(doc['doc_id'])['AvailableQuantity'] == 2
+
+
+def test_nested_transaction_rolls_back_with_the_outer_one(make_managers, options):
+    reader_manager, doc_manager, _ = make_managers(**options)
+    first = doc_manager.add_document("Lập trình Python", "Sách", 2)
+
+    with pytest.raises(RuntimeError):
+        with transaction(reader_manager, doc_manager):
+            second = doc_manager.add_document("Cấu trúc dữ liệu", "Sách", 1)
+            register(reader_manager)
+            raise RuntimeError("hủy")
+
+    assert doc_manager.get_document_details(second['doc_id']) is None
+    assert reader_manager.readers == []
+    _, reopened, _ = make_managers(**options)
+    assert [d['doc_id'] for d in reopened.documents] == [first['doc_id']]
+
+
+@pytest.mark.parametrize("operation", ["update", "delete"])
+def test_validation_failure_after_in_memory_changes_rolls_back(make_managers, options, operation):
+    reader_manager, doc_manager, borrowing_manager = make_managers(**options)
+    first = register(reader_manager, "Nguyễn Văn A", 1)
+    second = register(reader_manager, "Trần Thị B", 2)
+    doc = doc_manager.add_document("Lập trình Python", "Sách", 1)
+    borrow = borrowing_manager.create_borrow_record(first['reader_id'], [doc['doc_id']], reader_manager, doc_manager)
+    returned = borrowing_manager.create_return_record(borrow['borrow_id'], [doc['doc_id']], reader_manager, doc_manager)
+    borrowing_manager.create_borrow_record(second['reader_id'], [doc['doc_id']], reader_manager, doc_manager)
+
+    # Phiếu trả được mở lại: lượt mượn của độc giả đầu được khôi phục trong bộ nhớ trước khi
+    # borrow_document báo lỗi vì bản sao duy nhất đang được độc giả thứ hai mượn
+    with pytest.raises(ValueError):
+        if operation == "update":
+            borrowing_manager.update_return_record(returned['return_id'], [], reader_manager, doc_manager)
+        else:
+            borrowing_manager.delete_return_record(returned['return_id'], reader_manager, doc_manager)
+
+    for manager in (reader_manager, doc_manager, borrowing_manager):
+        manager.close()
+    for readers, docs, borrowing in ((reader_manager, doc_manager, borrowing_manager), make_managers(**options)):
+        details = readers.get_reader_details(first['reader_id'])
+        assert details['borrowed_books'] == 0
+        assert [record['status'] for record in details['borrow_history']] == ["returned"]
+        assert readers.find_active_loan(details, doc['doc_id']) is None
+        assert docs.get_document_details(doc['doc_id'])['AvailableQuantity'] == 0
+        assert borrowing.get_return_record_details(returned['return_id']) is not None